@@ -1,9 +1,9 @@
 # FILENAME: ML_Report2Doc.py
-# VERSION: 0.10
+# VERSION: 0.12
 #######################################
 # CHANGE LOG
 #######################################
-# 1. New Baseline Code
+# 1. main() backfills missing Place IDs with the batched, cached resolve_place_ids instead of one Geocoding request per row.
 
 import logging
 import google.auth
@@ -13,6 +13,9 @@ from googleapiclient.discovery import build
 import requests
 import json
 from collections import defaultdict
+from functions.ML_API_GoogleSheets import diff_sheet_ranges
+from functions.ML_Cache import normalize_point
+from functions.Data_Ingest.ML_Data_Cleanse import resolve_place_ids
 from secret.ML_config import SERVICE_ACCOUNT_FILE, SPREADSHEET_ID, SOURCE_SHEET, TARGET_SHEET, ROUTES_API_KEY, TARGET_GDOC, DEBUG_ALL, DEBUG_MILEAGE
 
 # Configure logging
@@ -55,18 +58,19 @@ def write_sheet(sheet_name, data):
     logger.debug(f"Data written to sheet {sheet_name}: {result}")
     return result
 
-# Get Place ID from Google Maps API using latitude and longitude
-def get_place_id(latitude, longitude):
-    url = f"https://maps.googleapis.com/maps/api/geocode/json?latlng={latitude},{longitude}&key={ROUTES_API_KEY}"
-    response = requests.get(url)
-    result = response.json()
-    
-    if result['status'] == 'OK':
-        place_id = result['results'][0]['place_id']
-        return place_id
-    else:
-        logger.warning(f"Failed to get Place ID for coordinates ({latitude}, {longitude}): {result}")
-        return ""
+# Write only the cells that changed since the sheet was read
+def write_sheet_changes(sheet_name, original_rows, updated_rows):
+    value_ranges = diff_sheet_ranges(sheet_name, original_rows, updated_rows)
+    if not value_ranges:
+        logger.debug(f"No changes to write to sheet: {sheet_name}")
+        return None
+    logger.debug(f"Writing {len(value_ranges)} changed range(s) to sheet: {sheet_name}")
+    result = sheets_service.spreadsheets().values().batchUpdate(
+        spreadsheetId=SPREADSHEET_ID,
+        body={'valueInputOption': 'RAW', 'data': value_ranges}
+    ).execute()
+    logger.debug(f"Changed cells written to sheet {sheet_name}: {result}")
+    return result
 
 # Write data to Google Doc as paragraphs
 def write_to_google_doc(doc_id, data, error_rows, route_errors):
@@ -179,6 +183,7 @@ def get_route_distance(locations):
 def main():
     logger.info("Starting the mileage log processing script.")
     data = read_sheet(SOURCE_SHEET)
+    original_data = [list(row) for row in data]  # Snapshot before Place IDs are filled in
     headers = data[0]
     rows = data[1:]
     
@@ -188,14 +193,17 @@ def main():
     route_errors = []
     updated_rows = [headers]  # Start with the headers
 
+    # Resolve every missing Place ID in one batch (deduplicated, cached, concurrent)
+    missing_coordinates = [(row[2], row[3]) for row in rows if len(row) >= 6 and (len(row) < 7 or not row[6])]
+    place_ids = resolve_place_ids(missing_coordinates) if missing_coordinates else {}
+
     for row in rows:
         if len(row) < 6:
             logger.warning(f"Skipping row with insufficient columns: {row}")
             error_rows.append(row)
             continue
         if len(row) < 7 or not row[6]:  # If "Place ID" is missing or empty
-            latitude, longitude = row[2], row[3]
-            place_id = get_place_id(latitude, longitude)
+            place_id = place_ids.get(normalize_point((row[2], row[3])), "")
             if len(row) < 7:
                 row.append(place_id)
             else:
@@ -212,8 +220,8 @@ def main():
         date_ordered_data[date].append((order, float(latitude), float(longitude), business_name, street_address, place_id, row))
         updated_rows.append(row)  # Add the updated row to the list
 
-    # Write the updated data back to the source sheet
-    write_sheet(SOURCE_SHEET, updated_rows)
+    # Write only the changed cells back to the source sheet
+    write_sheet_changes(SOURCE_SHEET, original_data, data)
 
     logger.debug(f"Ordered data by date: {date_ordered_data}")
     
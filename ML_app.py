@@ -1,17 +1,19 @@
 # FILE: ML_App.py
-# VERSION: 0.29
+# VERSION: 0.39
 ######################################
 # CHANGELOG
 ######################################
-# 1. Added explicit call to ML_Render_Control.main() to ensure rendering steps are executed.
-# 2. Added additional logging before and after the render_main() call.
-# 3. Corrected the import path for the render control script.
+# 1. --start/--end, --month, --quarter and --tax-year limit the report to one period of the log.
 
+import argparse
 import logging
-from collections import defaultdict
-from functions.ML_API_GoogleSheets import read_sheet
-from functions.ML_API_GoogleMaps import gMap_extract_distance_from_directions
-from secret.ML_config import SOURCE_SHEET, DEBUG_ALL, HEARTBEAT, DEBUG_MILEAGE
+from functions.ML_Pipeline import build_report_model, ROUTE_WORKERS
+from functions.ML_Distance_Estimate import ROAD_FACTOR
+from functions.Data_Ingest.ML_Date_Index import date_range_from_options
+from functions.ML_Metrics import reset_metrics, write_run_metrics
+from functions.RENDER.ML_Render_Dispatch import RENDER_TARGETS
+from functions.ML_Watch import SheetWatcher, WATCH_POLL_SECONDS, WATCH_TARGETS
+from secret.ML_config import DEBUG_ALL
 from functions.RENDER.ML_Render_Control import main as render_main
 
 # Configure logging
@@ -22,76 +24,63 @@ else:
 
 logger = logging.getLogger(__name__)
 
-def main():
-    logger.info("Step 01: Starting the mileage log processing script.")
-    if HEARTBEAT:
-        logger.info("HEARTBEAT: Script started")
-
-    # Read data from the source sheet
-    data = read_sheet(SOURCE_SHEET)
-    headers = data[0]
-    rows = data[1:]
-
-    if HEARTBEAT:
-        logger.info("HEARTBEAT: Data read from the source sheet")
-
-    # Process data (skip data cleansing for this example)
-    date_ordered_data = defaultdict(list)
-    error_rows = []
-    route_errors = []
-    updated_rows = [headers]  # Start with the headers
-
-    for row in rows:
-        if len(row) < 6:
-            logger.warning(f"Skipping row with insufficient columns: {row}")
-            error_rows.append(row)
-            continue
-
-        date = row[0]
-        order = int(row[1])
-        latitude = row[2]
-        longitude = row[3]
-        business_name = row[4]
-        street_address = row[5]
-        place_id = row[6]
-
-        date_ordered_data[date].append((order, float(latitude), float(longitude), business_name, street_address, place_id, row))
-        updated_rows.append(row)  # Add the updated row to the list
-
-    logger.info("Step 02: Ordered data by date.")
-    if HEARTBEAT:
-        logger.info("HEARTBEAT: Data processed and ordered by date")
-
-    # Sort the data by date and order
-    for date in date_ordered_data:
-        date_ordered_data[date] = sorted(date_ordered_data[date], key=lambda x: x[0])
-
-    # Sort the dates from least recent to most recent
-    sorted_dates = sorted(date_ordered_data.keys(), reverse=False)
-
-    # Prepare data to write to output
-    target_data = []
-
-    for date in sorted_dates:
-        locations = date_ordered_data[date]
-        gps_coordinates = [(lat, lng) for _, lat, lng, _, _, _, _ in locations]
-        street_addresses = [f'<li><a href="https://www.google.com/maps/place/?q=place_id:{place_id}">{address}</a></li>' for _, _, _, _, address, place_id, _ in locations]
-        notes = [f'<li>{purpose}</li>' for _, _, _, purpose, _, _, _ in locations]
-        total_distance, end_addresses, link = gMap_extract_distance_from_directions(gps_coordinates, DEBUG_MILEAGE)
-
-        if total_distance == 0:
-            route_errors.extend([row for _, _, _, _, _, _, row in locations])
-        else:
-            target_data.append([date, total_distance, f"<ol>{''.join(street_addresses)}</ol>", f"<ol>{''.join(notes)}</ol>"])
-
-    logger.info("Step 03: Final data prepared.")
-    if HEARTBEAT:
-        logger.info("HEARTBEAT: Final data prepared")
-
-    # Invoke the rendering control script
-    logger.info("Step 04: Invoking rendering control script.")
-    render_main()
-    logger.info("Rendering control script invoked.")
+# Command line options for a processing run
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build the mileage log report from the source sheet.")
+    parser.add_argument('--workers', type=int, default=ROUTE_WORKERS,
+                        help=f"Number of dates whose routes are resolved concurrently (default: {ROUTE_WORKERS}, 1 = sequential).")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Reuse the saved results of dates whose rows are unchanged since the last incremental run.")
+    parser.add_argument('--offline', action='store_true',
+                        help="Estimate miles from the sheet coordinates instead of calling the Directions API.")
+    parser.add_argument('--road-factor', type=float, default=ROAD_FACTOR,
+                        help=f"Multiplier applied to great-circle miles for offline estimates and distance checks (default: {ROAD_FACTOR}).")
+    parser.add_argument('--resume', action='store_true',
+                        help="Reuse the dates checkpointed by an interrupted or partly failed run and resolve only the rest.")
+    parser.add_argument('--refresh-sheet', action='store_true',
+                        help="Download the source sheet even if it is unchanged since the last run.")
+    parser.add_argument('--targets', nargs='+', type=str.upper, choices=RENDER_TARGETS, metavar='TARGET',
+                        help=f"Outputs to render concurrently: {', '.join(RENDER_TARGETS)} (default: those of OUTPUT_DESTINATION).")
+    parser.add_argument('--watch', action='store_true',
+                        help=f"Keep running and re-render (default: {', '.join(WATCH_TARGETS)}) whenever the log changes; implies --incremental.")
+    parser.add_argument('--poll-seconds', type=float, default=WATCH_POLL_SECONDS,
+                        help=f"Seconds between spreadsheet change checks in watch mode (default: {WATCH_POLL_SECONDS}).")
+    period = parser.add_argument_group('report period', "Only the rows of this period are processed (default: the whole log).")
+    period.add_argument('--start', metavar='YYYY-MM-DD', help="First date of the report.")
+    period.add_argument('--end', metavar='YYYY-MM-DD', help="Last date of the report.")
+    period.add_argument('--month', metavar='YYYY-MM', help="Report on one calendar month.")
+    period.add_argument('--quarter', metavar='YYYY-QN', help="Report on one calendar quarter, e.g. 2024-Q3.")
+    period.add_argument('--tax-year', type=int, metavar='YYYY', help="Report on the tax year starting in YYYY.")
+    args = parser.parse_args(argv)
+    try:
+        args.date_range = date_range_from_options(args.start, args.end, args.month, args.quarter, args.tax_year)
+    except ValueError as error:
+        parser.error(str(error))
+    return args
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.watch:
+        SheetWatcher(targets=args.targets or WATCH_TARGETS, poll_seconds=args.poll_seconds, max_workers=args.workers,
+                     offline=args.offline, road_factor=args.road_factor, date_range=args.date_range).run()
+        return
+
+    logger.info("Starting the mileage log processing script.")
+    metrics = reset_metrics()
+
+    # Read, group and route the source data once
+    with metrics.stage('build_report_model'):
+        report = build_report_model(max_workers=args.workers, incremental=args.incremental,
+                                    offline=args.offline, road_factor=args.road_factor,
+                                    refresh_sheet=args.refresh_sheet, resume=args.resume, date_range=args.date_range)
+
+    # Invoke the rendering control script with the computed report model
+    with metrics.stage('render'):
+        render_main(report, args.targets)
+
+    write_run_metrics()
+    logger.info("Mileage log processing completed.")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,168 @@
+# FILE: ML_Benchmark.py
+# VERSION: 0.06
+######################################
+# CHANGELOG
+######################################
+# 1. Times a cold full pipeline run (fresh process, empty cache/ and OUTPUT/) before the per-stage runs; the warm run stays a separate figure and every stage reports its API calls.
+
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from ML_Stub_Server import StubState, start_stub_server
+from ML_Synthetic_Log import generate_log, LOG_SIZES
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Configuration used for benchmark runs; written to a private secret/ML_config.py so a
+# benchmark never touches the real spreadsheet, keys or output settings
+BENCHMARK_CONFIG = """\
+SERVICE_ACCOUNT_FILE = 'unused-service-account.json'
+SPREADSHEET_ID = 'benchmark-spreadsheet'
+SOURCE_SHEET = 'Log'
+TARGET_SHEET = 'Report'
+TARGET_GDOC = 'benchmark-doc'
+ROUTES_API_KEY = 'benchmark-key'
+DEBUG_ALL = False
+DEBUG_MILEAGE = False
+HEARTBEAT = False
+OUTPUT_DESTINATION = {output_destination!r}
+"""
+
+
+# Fetch the stand-in server's call counters.
+def _server_calls(base_url):
+    with urllib.request.urlopen(f"{base_url}/_stats") as response:
+        return json.load(response)['calls']
+
+
+# Call counts made between two _server_calls snapshots.
+def _calls_since(before, after):
+    return {endpoint: count - before.get(endpoint, 0) for endpoint, count in after.items() if count - before.get(endpoint, 0)}
+
+
+# Time one stage and record its duration and the API calls it made.
+def _timed(results, name, base_url, function, *args, **kwargs):
+    before = _server_calls(base_url)
+    started = time.perf_counter()
+    value = function(*args, **kwargs)
+    results['stages'][name] = {
+        'seconds': round(time.perf_counter() - started, 4),
+        'api_calls': _calls_since(before, _server_calls(base_url)),
+    }
+    return value
+
+
+# Run ML_app.main in a fresh process and its own working directory, so the module-level
+# clients and the route, leg, geocode and sheet snapshot caches and OUTPUT/ all start empty.
+def _run_pipeline_cold(work_dir, workers):
+    cold_dir = os.path.join(work_dir, 'cold')
+    os.makedirs(os.path.join(cold_dir, 'OUTPUT'))
+    code = (f"import sys; sys.path[:0] = [{work_dir!r}, {REPO_ROOT!r}]; "
+            f"import ML_app; ML_app.main({['--workers', str(workers)]!r})")
+    subprocess.run([sys.executable, '-c', code], cwd=cold_dir, capture_output=True, text=True, check=True)
+
+
+# Benchmark one log size in this process. Runs in a scratch working directory so the cache/
+# and OUTPUT/ folders start empty, and must run before any repo module is imported.
+def run_single(row_count, latency_ms, error_rate, workers, skip_pdf):
+    work_dir = tempfile.mkdtemp(prefix='ml_benchmark_')
+    os.makedirs(os.path.join(work_dir, 'secret'))
+    os.makedirs(os.path.join(work_dir, 'OUTPUT'))
+    with open(os.path.join(work_dir, 'secret', 'ML_config.py'), 'w') as file:
+        file.write(BENCHMARK_CONFIG.format(output_destination='NONE' if skip_pdf else 'DRIVE'))
+    os.chdir(work_dir)
+    sys.path[:0] = [work_dir, REPO_ROOT]
+
+    log_rows = generate_log(row_count)
+    server, base_url = start_stub_server(StubState(log_rows, latency_ms, error_rate, seed=row_count))
+    os.environ['ML_MAPS_API_BASE'] = f"{base_url}/maps/api"
+    os.environ['ML_SHEETS_API_ENDPOINT'] = f"{base_url}/"
+    os.environ['ML_DRIVE_API_ENDPOINT'] = f"{base_url}/drive/v3/"
+
+    results = {'rows': row_count, 'latency_ms': latency_ms, 'error_rate': error_rate, 'workers': workers, 'stages': {}}
+
+    # Full pipeline from nothing: what a first run of ML_app costs, imports and API calls included
+    _timed(results, 'pipeline_cold', base_url, _run_pipeline_cold, work_dir, workers)
+
+    # Cold-start cost of importing the repo modules (API clients are built later, on first use)
+    def import_modules():
+        import ML_app
+        from functions.ML_API_GoogleSheets import read_sheet_rows
+        from functions.Data_Ingest.ML_Data_Processing import cleanse_rows
+        from functions.ML_Pipeline import build_target_data
+        from functions.RENDER.ML_Render_HTML import drive_Output_HTML
+        from functions.RENDER.ML_Render_PDF import generate_report_pdf_with_timestamp
+        return ML_app, read_sheet_rows, cleanse_rows, build_target_data, drive_Output_HTML, generate_report_pdf_with_timestamp
+
+    ML_app, read_sheet_rows, cleanse_rows, build_target_data, drive_Output_HTML, generate_report_pdf_with_timestamp = \
+        _timed(results, 'import', base_url, import_modules)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    sheet_rows = _timed(results, 'read', base_url, read_sheet_rows, 'Log')
+    _timed(results, 'read_snapshot', base_url, read_sheet_rows, 'Log')
+    date_ordered_data, error_rows = _timed(results, 'group', base_url, cleanse_rows, sheet_rows[1:])
+    target_data, route_errors = _timed(results, 'route', base_url, build_target_data, date_ordered_data, workers)
+    html_file_path, html_content = _timed(results, 'render_html', base_url, drive_Output_HTML, target_data)
+    if not skip_pdf:
+        _timed(results, 'render_pdf', base_url, generate_report_pdf_with_timestamp, target_data, html_content)
+
+    # Full pipeline again with the caches filled by the stages above
+    _timed(results, 'pipeline_warm', base_url, ML_app.main, ['--workers', str(workers)])
+
+    results['dates'] = len(date_ordered_data)
+    results['error_rows'] = len(error_rows)
+    results['route_errors'] = len(route_errors)
+    results['rows_per_second'] = {
+        name: round(row_count / stage['seconds'], 1)
+        for name, stage in results['stages'].items() if stage['seconds'] and name != 'import'
+    }
+    server.shutdown()
+    return results
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the mileage log pipeline against the local stand-in server.")
+    parser.add_argument('--sizes', nargs='+', default=list(LOG_SIZES), help=f"Log sizes to run: {', '.join(LOG_SIZES)} or row counts.")
+    parser.add_argument('--latency-ms', type=float, default=20.0, help="Latency added to every stand-in API response.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of API calls answered with a throttling error.")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent route lookups.")
+    parser.add_argument('--skip-pdf', action='store_true', help="Skip PDF rendering (slow for the largest logs).")
+    parser.add_argument('--output', help="Write the results as JSON to this file.")
+    parser.add_argument('--single', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    if args.single is not None:
+        print(json.dumps(run_single(args.single, args.latency_ms, args.error_rate, args.workers, args.skip_pdf)))
+        return
+
+    # Every size runs in its own process so module-level clients and caches start cold
+    all_results = []
+    for size in args.sizes:
+        row_count = LOG_SIZES.get(size) or int(size)
+        command = [sys.executable, os.path.abspath(__file__), '--single', str(row_count),
+                   '--latency-ms', str(args.latency_ms), '--error-rate', str(args.error_rate), '--workers', str(args.workers)]
+        if args.skip_pdf:
+            command.append('--skip-pdf')
+        completed = subprocess.run(command, capture_output=True, text=True, check=True)
+        results = json.loads(completed.stdout.strip().splitlines()[-1])
+        all_results.append(results)
+        stage_text = ', '.join(f"{name} {stage['seconds']:.3f}s/{sum(stage['api_calls'].values())} calls"
+                               for name, stage in results['stages'].items())
+        print(f"{row_count} rows / {results['dates']} dates: {stage_text}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(all_results, file, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,367 @@
+# FILE: ML_Stub_Server.py
+# VERSION: 0.05
+######################################
+# CHANGELOG
+######################################
+# 1. Sheets spreadsheets.get: tab titles and grid row counts, used to page reads to the end of the data.
+
+import argparse
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+from ML_Synthetic_Log import generate_log, LOG_SIZES
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_METERS = 6371008.8
+ROAD_FACTOR = 1.3
+MAX_WAYPOINTS = 25
+
+# New tabs in Google Sheets have 1000 rows; the grid grows with the data
+GRID_MIN_ROWS = 1000
+
+_SPREADSHEET_PATH = re.compile(r'^/v4/spreadsheets/[^/]+$')
+_A1_PATTERN = re.compile(r"^(?P<c1>[A-Z]+)?(?P<r1>\d+)?(?::(?P<c2>[A-Z]+)?(?P<r2>\d+)?)?$")
+
+
+# Road-ish distance in meters between two (lat, lng) points: great circle times ROAD_FACTOR.
+def _leg_meters(origin, destination):
+    lat1, lng1, lat2, lng2 = map(math.radians, (*origin, *destination))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return int(2 * EARTH_RADIUS_METERS * math.asin(math.sqrt(min(1.0, a))) * ROAD_FACTOR)
+
+
+# Parse "lat,lng" into a float pair.
+def _parse_point(text):
+    latitude, longitude = text.split(',')
+    return float(latitude), float(longitude)
+
+
+# Match the cell part of an A1 range ("Tab!A2:G10" -> A2:G10); a bare tab name covers the whole sheet.
+def _match_a1(a1_range):
+    cells = a1_range.split('!', 1)[1] if '!' in a1_range else ''
+    return _A1_PATTERN.match(cells)
+
+
+# Convert A1 column letters to a 0-based index.
+def _column_index(letters):
+    index = 0
+    for letter in letters:
+        index = index * 26 + (ord(letter) - ord('A') + 1)
+    return index - 1
+
+
+class StubState:
+    # Shared state of the stand-in server: the sheet tabs (the log in sheet_name, other tabs created
+    # on first write), the injected latency and error rate, and call counts per endpoint and status.
+
+    def __init__(self, sheet_rows=None, latency_ms=0.0, error_rate=0.0, seed=None, sheet_name='Log', max_qps=None):
+        self.tabs = {sheet_name: sheet_rows or []}
+        self.sheet_name = sheet_name
+        self.latency_ms = latency_ms
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.version = 1
+        self.modified_time = self._now()
+        self.max_qps = max_qps
+        self.recent_calls = defaultdict(deque)
+
+    @staticmethod
+    def _now():
+        return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+    # Record a change to the spreadsheet (call with the lock held).
+    def touch(self):
+        self.version += 1
+        self.modified_time = self._now()
+
+    @property
+    def sheet_rows(self):
+        return self.tabs[self.sheet_name]
+
+    # Rows of the tab an A1 range refers to ("'My Tab'!A1:B2" -> My Tab).
+    def tab_rows(self, a1_range):
+        tab_name = a1_range.split('!', 1)[0].strip("'").replace("''", "'")
+        return self.tabs.setdefault(tab_name, [])
+
+    # Count a call and decide whether to inject an error for it.
+    def record(self, endpoint, status):
+        with self.lock:
+            self.calls[f"{endpoint}:{status}"] += 1
+
+    # Whether a call to endpoint goes over the max_qps quota (calls in the last second).
+    def over_quota(self, endpoint):
+        if not self.max_qps:
+            return False
+        now = time.monotonic()
+        with self.lock:
+            recent = self.recent_calls[endpoint]
+            while recent and now - recent[0] >= 1.0:
+                recent.popleft()
+            if len(recent) >= self.max_qps:
+                return True
+            recent.append(now)
+            return False
+
+    def should_fail(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+    def stats(self):
+        with self.lock:
+            return dict(self.calls)
+
+    def reset(self):
+        with self.lock:
+            self.calls.clear()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _delay(self):
+        if self.server.state.latency_ms:
+            time.sleep(self.server.state.latency_ms / 1000.0)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        query = parse_qs(parsed.query)
+        path = parsed.path
+        state = self.server.state
+
+        if path == '/_stats':
+            return self._send_json({'calls': state.stats()})
+
+        self._delay()
+        if path.startswith('/drive/v3/files/'):
+            return self._drive_file()
+        if path.endswith('/directions/json'):
+            return self._directions(query)
+        if path.endswith('/geocode/json'):
+            return self._geocode(query)
+        if _SPREADSHEET_PATH.match(path):
+            return self._sheets_metadata()
+        if path.endswith('/values:batchGet'):
+            return self._sheets_batch_get(query)
+        if '/values/' in path:
+            return self._sheets_get(unquote(path.split('/values/', 1)[1]))
+        self._send_json({'error': {'code': 404, 'message': f"Unknown path {path}"}}, 404)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        state = self.server.state
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        if parsed.path == '/_reset':
+            state.reset()
+            return self._send_json({})
+
+        self._delay()
+        if parsed.path.endswith('/values:batchUpdate'):
+            return self._sheets_batch_update(body)
+        if '/values/' in parsed.path and parsed.path.endswith(':clear'):
+            return self._sheets_clear(unquote(parsed.path.split('/values/', 1)[1])[:-len(':clear')])
+        self._send_json({'error': {'code': 404, 'message': f"Unknown path {parsed.path}"}}, 404)
+
+    # values.update: write one value range.
+    def do_PUT(self):
+        parsed = urlparse(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        self._delay()
+        if '/values/' in parsed.path:
+            a1_range = unquote(parsed.path.split('/values/', 1)[1])
+            return self._sheets_batch_update({'data': [dict(body, range=a1_range)]}, endpoint='sheets.update')
+        self._send_json({'error': {'code': 404, 'message': f"Unknown path {parsed.path}"}}, 404)
+
+    # Drive files.get: revision metadata of the spreadsheet.
+    def _drive_file(self):
+        state = self.server.state
+        state.record('drive.files.get', 200)
+        with state.lock:
+            self._send_json({'version': str(state.version), 'modifiedTime': state.modified_time})
+
+    # Directions: one leg per consecutive pair of points, distance from the great circle.
+    def _directions(self, query):
+        state = self.server.state
+        if state.over_quota('directions') or state.should_fail():
+            state.record('directions', 'OVER_QUERY_LIMIT')
+            return self._send_json({'status': 'OVER_QUERY_LIMIT', 'routes': []})
+
+        waypoints = [text for text in query.get('waypoints', [''])[0].split('|') if text]
+        if len(waypoints) > MAX_WAYPOINTS:
+            state.record('directions', 'MAX_WAYPOINTS_EXCEEDED')
+            return self._send_json({'status': 'MAX_WAYPOINTS_EXCEEDED', 'routes': []})
+
+        points = [_parse_point(query['origin'][0])] + [_parse_point(text) for text in waypoints] + [_parse_point(query['destination'][0])]
+        legs = [
+            {
+                'distance': {'value': _leg_meters(points[index], points[index + 1])},
+                'end_address': f"{points[index + 1][0]:.5f}, {points[index + 1][1]:.5f}, Synthetic City",
+            }
+            for index in range(len(points) - 1)
+        ]
+        state.record('directions', 'OK')
+        self._send_json({'status': 'OK', 'routes': [{'legs': legs}]})
+
+    # Geocoding: a stable synthetic Place ID per coordinate pair.
+    def _geocode(self, query):
+        state = self.server.state
+        if state.over_quota('geocode') or state.should_fail():
+            state.record('geocode', 'OVER_QUERY_LIMIT')
+            return self._send_json({'status': 'OVER_QUERY_LIMIT', 'results': []})
+        latitude, longitude = _parse_point(query['latlng'][0])
+        state.record('geocode', 'OK')
+        self._send_json({'status': 'OK', 'results': [{'place_id': f"stub-{latitude:.5f}-{longitude:.5f}"}]})
+
+    # spreadsheets.get: the title and grid row count of every tab.
+    def _sheets_metadata(self):
+        state = self.server.state
+        state.record('sheets.spreadsheets.get', 200)
+        with state.lock:
+            sheets = [{'properties': {'title': title, 'gridProperties': {'rowCount': max(GRID_MIN_ROWS, len(rows))}}}
+                      for title, rows in state.tabs.items()]
+        self._send_json({'sheets': sheets})
+
+    # Return the cells of an A1 range the way the Sheets API does (trailing blanks trimmed).
+    def _range_values(self, a1_range):
+        match = _match_a1(a1_range)
+        rows = self.server.state.tab_rows(a1_range)
+        if not match:
+            return []
+        first_row = int(match['r1'] or 1) - 1
+        last_row = int(match['r2']) if match['r2'] else len(rows)
+        first_col = _column_index(match['c1']) if match['c1'] else 0
+        last_col = _column_index(match['c2']) + 1 if match['c2'] else None
+        values = [row[first_col:last_col] for row in rows[first_row:last_row]]
+        while values and not values[-1]:
+            values.pop()
+        return values
+
+    def _sheets_get(self, a1_range):
+        state = self.server.state
+        if state.over_quota('sheets'):
+            state.record('sheets.get', 429)
+            return self._send_json({'error': {'code': 429, 'message': 'Quota exceeded', 'status': 'RESOURCE_EXHAUSTED'}}, 429)
+        if state.should_fail():
+            state.record('sheets.get', 503)
+            return self._send_json({'error': {'code': 503, 'message': 'Injected error'}}, 503)
+        state.record('sheets.get', 200)
+        value_range = {'range': a1_range, 'majorDimension': 'ROWS'}
+        values = self._range_values(a1_range)
+        if values:
+            value_range['values'] = values
+        self._send_json(value_range)
+
+    def _sheets_batch_get(self, query):
+        state = self.server.state
+        if state.over_quota('sheets'):
+            state.record('sheets.batchGet', 429)
+            return self._send_json({'error': {'code': 429, 'message': 'Quota exceeded', 'status': 'RESOURCE_EXHAUSTED'}}, 429)
+        if state.should_fail():
+            state.record('sheets.batchGet', 503)
+            return self._send_json({'error': {'code': 503, 'message': 'Injected error'}}, 503)
+        state.record('sheets.batchGet', 200)
+        value_ranges = []
+        for a1_range in query.get('ranges', []):
+            value_range = {'range': a1_range, 'majorDimension': 'ROWS'}
+            values = self._range_values(a1_range)
+            if values:
+                value_range['values'] = values
+            value_ranges.append(value_range)
+        self._send_json({'spreadsheetId': 'stub', 'valueRanges': value_ranges})
+
+    # Apply batchUpdate value ranges to the in-memory tabs.
+    def _sheets_batch_update(self, body, endpoint='sheets.batchUpdate'):
+        state = self.server.state
+        state.record(endpoint, 200)
+        updated_cells = 0
+        with state.lock:
+            state.touch()
+            for value_range in body.get('data', []):
+                match = _match_a1(value_range['range'])
+                sheet_rows = state.tab_rows(value_range['range'])
+                first_row = int(match['r1'] or 1) - 1
+                first_col = _column_index(match['c1']) if match['c1'] else 0
+                for row_offset, values in enumerate(value_range.get('values', [])):
+                    while len(sheet_rows) <= first_row + row_offset:
+                        sheet_rows.append([])
+                    row = sheet_rows[first_row + row_offset]
+                    for col_offset, value in enumerate(values):
+                        while len(row) <= first_col + col_offset:
+                            row.append('')
+                        row[first_col + col_offset] = value
+                        updated_cells += 1
+        self._send_json({'spreadsheetId': 'stub', 'totalUpdatedCells': updated_cells})
+
+    # values.clear: only whole tabs are cleared.
+    def _sheets_clear(self, a1_range):
+        state = self.server.state
+        state.record('sheets.clear', 200)
+        with state.lock:
+            state.touch()
+            state.tab_rows(a1_range).clear()
+        self._send_json({'spreadsheetId': 'stub', 'clearedRange': a1_range})
+
+
+# Start the stand-in server on a background thread. Returns (server, base_url); the Maps
+# base URL is f"{base_url}/maps/api"; the Sheets endpoint is f"{base_url}/"
+# and the Drive endpoint f"{base_url}/drive/v3/".
+def start_stub_server(state, host='127.0.0.1', port=0):
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = state
+    thread = threading.Thread(target=server.serve_forever, name='stub-server', daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}"
+    logger.info(f"Stub server listening on {base_url}")
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the local Google Maps/Sheets stand-in server.")
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--rows', default='1k', help=f"Synthetic log size: {', '.join(LOG_SIZES)} or a row count.")
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Delay added to every API response.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of API calls answered with a throttling error.")
+    parser.add_argument('--max-qps', type=float, help="Per-endpoint quota; calls over it are throttled.")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    row_count = LOG_SIZES.get(args.rows) or int(args.rows)
+    server, base_url = start_stub_server(StubState(generate_log(row_count), args.latency_ms, args.error_rate, max_qps=args.max_qps), port=args.port)
+    print(f"ML_MAPS_API_BASE={base_url}/maps/api")
+    print(f"ML_SHEETS_API_ENDPOINT={base_url}/")
+    print(f"ML_DRIVE_API_ENDPOINT={base_url}/drive/v3/")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == '__main__':
+    main()
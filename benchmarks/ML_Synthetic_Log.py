@@ -0,0 +1,51 @@
+# FILE: ML_Synthetic_Log.py
+# VERSION: 0.01
+######################################
+# CHANGELOG
+######################################
+# 1. Initial version: deterministic synthetic mileage logs for benchmarks (1k, 10k and 100k rows).
+
+import random
+from datetime import date, timedelta
+
+HEADERS = ['Date', 'Order', 'Latitude', 'Longitude', 'Business Name', 'Street Address', 'Place ID']
+
+# Standard benchmark sizes (data rows, excluding the header)
+LOG_SIZES = {'1k': 1000, '10k': 10000, '100k': 100000}
+
+# Synthetic crews work around this point (Los Angeles) and revisit a fixed pool of places
+CENTER = (34.0522, -118.2437)
+PLACE_COUNT = 400
+PLACE_SPREAD_DEGREES = 0.6
+STOPS_PER_DAY = (2, 9)
+
+
+# Build the pool of places a crew keeps revisiting: index 0 is home base.
+def _build_places(rng):
+    places = []
+    for index in range(PLACE_COUNT):
+        latitude = CENTER[0] + rng.uniform(-PLACE_SPREAD_DEGREES, PLACE_SPREAD_DEGREES)
+        longitude = CENTER[1] + rng.uniform(-PLACE_SPREAD_DEGREES, PLACE_SPREAD_DEGREES)
+        name = 'Home Base' if index == 0 else f"{rng.choice(['PC', 'LS', 'Studio', 'Stage', 'Rental'])}: Place {index}"
+        places.append((round(latitude, 6), round(longitude, 6), name, f"{100 + index} Synthetic Ave, Los Angeles, CA", f"synthetic-place-{index}"))
+    return places
+
+
+# Generate a mileage log with exactly row_count data rows (plus the header row). Days start
+# and usually end at home base, with 2-9 stops each; the same seed always gives the same log.
+def generate_log(row_count, seed=6, start_date=date(2020, 1, 1)):
+    rng = random.Random(seed)
+    places = _build_places(rng)
+    rows = [list(HEADERS)]
+    day = start_date
+
+    while len(rows) - 1 < row_count:
+        stop_count = min(rng.randint(*STOPS_PER_DAY), row_count - (len(rows) - 1))
+        stops = [places[0]] + [rng.choice(places[1:]) for _ in range(max(0, stop_count - 2))]
+        if stop_count >= 2:
+            stops.append(places[0] if rng.random() < 0.8 else rng.choice(places[1:]))
+        for order, (latitude, longitude, name, address, place_id) in enumerate(stops[:stop_count], start=1):
+            rows.append([day.isoformat(), str(order), str(latitude), str(longitude), name, address, place_id])
+        day += timedelta(days=1)
+
+    return rows
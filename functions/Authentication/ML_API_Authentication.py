@@ -0,0 +1,105 @@
+# FILE: ML_API_Authentication.py
+# VERSION: 0.03
+######################################
+# CHANGELOG
+######################################
+# 1. Each API client gets only its own scopes (GOOGLE_SCOPES): Drive is limited to reading file metadata
+#    instead of every client holding full read/write access to the whole Drive.
+
+import logging
+import random
+import threading
+import time
+from functions.ML_Metrics import get_metrics
+from functions.ML_Rate_Limiter import get_rate_limiter
+from secret.ML_config import SERVICE_ACCOUNT_FILE
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Least-privilege scopes per API. Drive is only used to read the spreadsheet's revision, and
+# the Docs output creates and fills documents through the Docs API alone.
+GOOGLE_SCOPES = {
+    'sheets': ['https://www.googleapis.com/auth/spreadsheets'],
+    'docs': ['https://www.googleapis.com/auth/documents'],
+    'drive': ['https://www.googleapis.com/auth/drive.metadata.readonly'],
+}
+
+# Throttled requests (HTTP 429 or a 403 rate limit error) are retried with exponential backoff
+# and full jitter; they were rejected before being applied, so retrying writes is safe too
+GOOGLE_MAX_RETRIES = 5
+GOOGLE_BACKOFF_BASE = 1.0       # seconds, doubled on every retry
+GOOGLE_BACKOFF_MAX = 32         # seconds
+RATE_LIMIT_REASONS = (b'rateLimitExceeded', b'userRateLimitExceeded', b'RATE_LIMIT_EXCEEDED')
+
+_credentials = {}
+_services = {}
+_lock = threading.Lock()
+
+# Build the credentials for an API on first use: the key file is read once, and each API gets a
+# copy scoped to GOOGLE_SCOPES[api] with its own access token (refreshed only once it has expired).
+# googleapiclient and google-auth are only imported here and in get_service, so importing a
+# module that talks to Google costs nothing until a call is made.
+def _get_credentials_locked(api):
+    if api not in _credentials:
+        if None not in _credentials:
+            from google.oauth2 import service_account
+            logger.debug(f"Loading service account credentials from {SERVICE_ACCOUNT_FILE}")
+            _credentials[None] = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_FILE)
+        _credentials[api] = _credentials[None].with_scopes(GOOGLE_SCOPES[api])
+    return _credentials[api]
+
+def get_credentials(api):
+    with _lock:
+        return _get_credentials_locked(api)
+
+# The API service client for (api, version), built once per process and then shared. The
+# discovery document comes from the copies bundled with google-api-python-client, so building
+# never fetches it over the network. With api_endpoint (e.g. the local stand-in server)
+# requests go there unauthenticated.
+def get_service(api, version, api_endpoint=None):
+    key = (api, version, api_endpoint)
+    with _lock:
+        service = _services.get(key)
+        if service is None:
+            from googleapiclient.discovery import build
+            if api_endpoint:
+                from google.auth.credentials import AnonymousCredentials
+                service = build(api, version, credentials=AnonymousCredentials(), cache_discovery=False, static_discovery=True,
+                                client_options={'api_endpoint': api_endpoint})
+            else:
+                service = build(api, version, credentials=_get_credentials_locked(api), cache_discovery=False, static_discovery=True)
+            _services[key] = service
+            logger.debug(f"Built Google API client {api} {version}")
+        return service
+
+
+# Whether an HttpError is Google rejecting the request for going over quota.
+def _is_throttled(error):
+    if error.resp.status == 429:
+        return True
+    return error.resp.status == 403 and any(reason in (error.content or b'') for reason in RATE_LIMIT_REASONS)
+
+# Execute a Google API request (e.g. endpoint 'sheets.values.get') through the shared rate
+# limiter. Every attempt is recorded in the run metrics with its status and latency.
+def execute_request(endpoint, request, max_retries=GOOGLE_MAX_RETRIES):
+    from googleapiclient.errors import HttpError
+    limiter = get_rate_limiter()
+
+    for attempt in range(max_retries + 1):
+        limiter.acquire(endpoint)
+        started = time.perf_counter()
+        try:
+            result = request.execute()
+        except HttpError as error:
+            get_metrics().record_api_call(endpoint, error.resp.status, time.perf_counter() - started)
+            if not _is_throttled(error) or attempt == max_retries:
+                raise
+            limiter.throttled(endpoint)
+            delay = random.uniform(0, min(GOOGLE_BACKOFF_MAX, GOOGLE_BACKOFF_BASE * (2 ** attempt)))
+            logger.warning(f"{endpoint} was throttled (HTTP {error.resp.status}); retrying in {delay:.2f}s (attempt {attempt + 1}/{max_retries}).")
+            time.sleep(delay)
+            continue
+        get_metrics().record_api_call(endpoint, 200, time.perf_counter() - started)
+        limiter.succeeded(endpoint)
+        return result
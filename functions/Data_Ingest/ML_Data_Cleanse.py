@@ -1,46 +1,120 @@
 # FILENAME: ML_data_cleanse.py
-# VERSION: 0.01
+# VERSION: 0.04
 #######################################
 # CHANGE LOG
 #######################################
-# 1. Initial version
+# 1. resolve_place_ids catches lookup failures per location and caches each resolved Place ID as it arrives, so one failed lookup no longer discards the whole batch.
 
 import logging
-from functions.ML_API_GoogleMaps import get_place_id
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from operator import attrgetter
+from functions.ML_API_GoogleMaps import MapsAPIError, get_place_id
+from functions.ML_Cache import get_geocode_cache, normalize_point
+from functions.Data_Ingest.ML_Stop_Record import parse_stop
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Maximum number of geocoding requests in flight at once
+GEOCODE_WORKERS = 8
+# Resolved Place IDs are written to the geocode cache in batches of this size
+GEOCODE_CACHE_BATCH = 50
+
+# Resolve Place IDs for a collection of (lat, lng) pairs. Each unique location is looked up
+# once: first in the persistent geocode cache, then concurrently against the Geocoding API.
+# A failed lookup only loses its own location; every resolved Place ID is cached as the
+# lookups complete, so an interrupted run keeps what it already paid for.
+# Returns {normalized point: place_id}; locations that could not be resolved are left out.
+def resolve_place_ids(coordinates, max_workers=GEOCODE_WORKERS):
+    unique_points = {}
+    for latitude, longitude in coordinates:
+        unique_points.setdefault(normalize_point((latitude, longitude)), (latitude, longitude))
+
+    geocode_cache = get_geocode_cache()
+    place_ids = geocode_cache.get_many(unique_points.keys())
+    missing = [point_key for point_key in unique_points if point_key not in place_ids]
+
+    logger.info(f"Place ID lookup: {len(unique_points)} unique locations, {len(place_ids)} cached, {len(missing)} to resolve.")
+
+    if missing:
+        failed = 0
+        pending = {}
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix='geocode') as executor:
+                futures = {executor.submit(get_place_id, *unique_points[point_key]): point_key for point_key in missing}
+                for future in as_completed(futures):
+                    point_key = futures[future]
+                    try:
+                        place_id = future.result()
+                    except MapsAPIError as error:
+                        logger.warning(f"Place ID lookup failed for {unique_points[point_key]}: {error}")
+                        failed += 1
+                        continue
+                    except Exception:
+                        logger.exception(f"Place ID lookup failed unexpectedly for {unique_points[point_key]}")
+                        failed += 1
+                        continue
+                    if not place_id:  # No result for this location; not cached so a later run retries it
+                        failed += 1
+                        continue
+                    place_ids[point_key] = pending[point_key] = place_id
+                    if len(pending) >= GEOCODE_CACHE_BATCH:
+                        geocode_cache.put_many(pending)
+                        pending = {}
+        finally:
+            if pending:
+                geocode_cache.put_many(pending)
+        if failed:
+            logger.warning(f"Place ID lookup: {failed} of {len(missing)} locations could not be resolved.")
+
+    return place_ids
+
 def preprocess_data(rows, headers, heartbeat):
     date_ordered_data = defaultdict(list)
     error_rows = []
     updated_rows = [headers]  # Start with the headers
 
-    for i, row in enumerate(rows):
+    # First pass: validate rows and collect the coordinates whose Place ID is missing
+    valid_rows = []
+    missing_coordinates = []
+    for row_number, row in enumerate(rows, start=2):  # Row 1 holds the headers
         if len(row) < 6:
             logger.warning(f"Skipping row with insufficient columns: {row}")
             error_rows.append(row)
             continue
+        try:
+            int(row[1])
+            float(row[2])
+            float(row[3])
+        except ValueError:
+            logger.warning(f"Skipping row with invalid order or coordinates: {row}")
+            error_rows.append(row)
+            continue
+        valid_rows.append((row_number, row))
         if len(row) < 7 or not row[6]:  # If "Place ID" is missing or empty
-            latitude, longitude = row[2], row[3]
-            place_id = get_place_id(latitude, longitude)
+            missing_coordinates.append((row[2], row[3]))
+
+    place_ids = resolve_place_ids(missing_coordinates) if missing_coordinates else {}
+
+    # Second pass: fill in Place IDs and group the rows by date
+    for i, (row_number, row) in enumerate(valid_rows):
+        if len(row) < 7 or not row[6]:
+            place_id = place_ids.get(normalize_point((row[2], row[3])), "")  # Left empty when the lookup failed
             if len(row) < 7:
                 row.append(place_id)
             else:
                 row[6] = place_id
-        
-        date = row[0]
-        order = int(row[1])
-        latitude = row[2]
-        longitude = row[3]
-        business_name = row[4]
-        street_address = row[5]
-        place_id = row[6]
-        
-        date_ordered_data[date].append((order, float(latitude), float(longitude), business_name, street_address, place_id, row))
+
+        date, stop = parse_stop(row, row_number)
+        date_ordered_data[date].append(stop)
         updated_rows.append(row)  # Add the updated row to the list
 
         if heartbeat and i % 10 == 0:
             logger.info(f"Processed {i + 1} rows")
 
+    # Sort each day's stops by order
+    for stops in date_ordered_data.values():
+        stops.sort(key=attrgetter('order'))
+
     return date_ordered_data, error_rows, updated_rows
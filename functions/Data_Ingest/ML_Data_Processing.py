@@ -0,0 +1,168 @@
+# FILE: ML_Data_Processing.py
+# VERSION: 0.03
+######################################
+# CHANGELOG
+######################################
+# 1. cleanse_rows takes the list of SheetRow from read_sheet_rows as is instead of copying it.
+# 2. cleanse_rows is the only grouping path; its comment no longer refers to the removed group_stops_by_date.
+
+import logging
+import re
+from collections import defaultdict
+from datetime import datetime
+import numpy as np
+from functions.Data_Ingest.ML_Stop_Record import StopRecord
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Date formats accepted in the Date column
+ACCEPTED_DATE_FORMATS = ('%Y-%m-%d', '%m/%d/%Y', '%m/%d/%y')
+
+# Format of the date keys of the grouped data, and so of the dates shown in the report
+REPORT_DATE_FORMAT = '%Y-%m-%d'
+
+# A single hop between consecutive stops longer than this is treated as a bad coordinate
+MAX_HOP_MILES = 500.0
+
+EARTH_RADIUS_MILES = 3958.7613
+
+# Largest stop order accepted (in absolute value); anything beyond is a typo, not a stop
+MAX_STOP_ORDER = 10000
+
+# Minimum columns a row needs: Date, Order, Latitude, Longitude, Business Name, Street Address
+MIN_COLUMNS = 6
+
+_DIGITS_PATTERN = re.compile(r'\d')
+
+
+# Great-circle distance in miles between arrays of points (degrees), element-wise.
+def haversine_miles(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = (np.radians(np.asarray(values, dtype=float)) for values in (lat1, lng1, lat2, lng2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# Parse a date string with the accepted formats; returns a datetime.date or None.
+def parse_log_date(text):
+    text = text.strip()
+    if not _DIGITS_PATTERN.search(text):
+        return None
+    for date_format in ACCEPTED_DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+# Convert a list of strings to a float array in one go; cells that are not numbers become NaN.
+def _to_float_array(strings):
+    try:
+        return np.asarray(strings, dtype=float)
+    except ValueError:
+        values = np.full(len(strings), np.nan)
+        for index, text in enumerate(strings):
+            try:
+                values[index] = float(text)
+            except ValueError:
+                pass
+        return values
+
+
+# Validate and group the whole sheet in bulk. sheet_rows is a list of SheetRow(row_number, values).
+# The columns are parsed into arrays once and checked together for:
+#   - missing columns
+#   - latitude/longitude that are not numbers or out of range
+#   - stop orders that are not whole numbers, not finite or above MAX_STOP_ORDER
+#   - dates not matching ACCEPTED_DATE_FORMATS
+#   - duplicate (date, order) pairs (the first occurrence is kept)
+#   - outlier hops: a stop more than MAX_HOP_MILES away from both its neighbours
+# Failing rows go to error_rows instead of aborting the run. Days are matched on the parsed
+# date, whatever format each cell uses. Returns ({date: [StopRecord, ...] sorted by order},
+# error_rows), with dates as REPORT_DATE_FORMAT strings and error_rows the raw row values.
+def cleanse_rows(sheet_rows, max_hop_miles=MAX_HOP_MILES):
+    count = len(sheet_rows)
+    date_ordered_data = defaultdict(list)
+    if not count:
+        return date_ordered_data, []
+
+    padded = [sheet_row.values + [''] * (7 - len(sheet_row.values)) for sheet_row in sheet_rows]
+    columns = list(zip(*padded))
+    row_numbers = np.fromiter((sheet_row.row_number for sheet_row in sheet_rows), dtype=np.int64, count=count)
+    column_counts = np.fromiter((len(sheet_row.values) for sheet_row in sheet_rows), dtype=np.int64, count=count)
+
+    dates = np.asarray(columns[0], dtype=str)
+    orders = _to_float_array(columns[1])
+    latitudes = _to_float_array(columns[2])
+    longitudes = _to_float_array(columns[3])
+
+    # Dates repeat for every stop of a day, so each distinct string is parsed only once. Rows are
+    # then keyed by the day's ordinal (-1 if invalid), so every spelling of a day is the same day.
+    unique_dates, date_index = np.unique(dates, return_inverse=True)
+    parsed_dates = [parse_log_date(text) for text in unique_dates]
+    day_index = np.array([parsed.toordinal() if parsed is not None else -1 for parsed in parsed_dates], dtype=np.int64)[date_index]
+    date_valid = day_index >= 0
+
+    reasons = np.full(count, '', dtype=object)
+
+    def flag(mask, reason):
+        mask = mask & (reasons == '')
+        reasons[mask] = reason
+
+    flag(column_counts < MIN_COLUMNS, 'insufficient columns')
+    flag(~date_valid, 'invalid date')
+    flag(~np.isfinite(orders) | (np.abs(orders) > MAX_STOP_ORDER) | (orders != np.floor(orders)), 'invalid order')
+    flag(np.isnan(latitudes) | (np.abs(latitudes) > 90), 'latitude out of range')
+    flag(np.isnan(longitudes) | (np.abs(longitudes) > 180), 'longitude out of range')
+
+    # Duplicate (date, order) pairs among the rows that are otherwise valid
+    valid = reasons == ''
+    valid_index = np.flatnonzero(valid)
+    keys = np.stack([day_index[valid_index], orders[valid_index].astype(np.int64)], axis=1)
+    _, first_seen = np.unique(keys, axis=0, return_index=True)
+    duplicate = np.ones(len(valid_index), dtype=bool)
+    duplicate[first_seen] = False
+    flag(np.isin(np.arange(count), valid_index[duplicate]), 'duplicate date/order')
+
+    # Outlier hops within each day, with the stops sorted by (date, order)
+    valid_index = np.flatnonzero(reasons == '')
+    ordered = valid_index[np.lexsort((orders[valid_index], day_index[valid_index]))]
+    if len(ordered) > 2:
+        same_day = day_index[ordered[1:]] == day_index[ordered[:-1]]
+        hops = haversine_miles(latitudes[ordered[:-1]], longitudes[ordered[:-1]], latitudes[ordered[1:]], longitudes[ordered[1:]])
+        long_hop = same_day & (hops > max_hop_miles)
+        # Per stop position: long hop arriving / leaving, and whether the neighbours are the same day
+        incoming = np.concatenate([[False], long_hop])
+        outgoing = np.concatenate([long_hop, [False]])
+        has_previous = np.concatenate([[False], same_day])
+        has_next = np.concatenate([same_day, [False]])
+        # Interior stops need a long hop on both sides. A day's first (last) stop is flagged when
+        # its only hop is long but the hop after (before) it is normal, i.e. the stop itself is off.
+        first_stop_off = outgoing & ~has_previous & np.concatenate([has_next[1:], [False]]) & ~np.concatenate([outgoing[1:], [False]])
+        last_stop_off = incoming & ~has_next & np.concatenate([[False], has_previous[:-1]]) & ~np.concatenate([[False], incoming[:-1]])
+        spike = (incoming & outgoing) | first_stop_off | last_stop_off
+        flag(np.isin(np.arange(count), ordered[spike]), 'outlier hop')
+
+    error_rows = []
+    for index in np.flatnonzero(reasons != ''):
+        logger.warning(f"Skipping row {row_numbers[index]} ({reasons[index]}): {sheet_rows[index].values}")
+        error_rows.append(sheet_rows[index].values)
+
+    # Group the remaining rows, already sorted by (date, order)
+    valid_index = np.flatnonzero(reasons == '')
+    report_dates = [parsed.strftime(REPORT_DATE_FORMAT) if parsed is not None else None for parsed in parsed_dates]
+    for index in valid_index[np.lexsort((orders[valid_index], day_index[valid_index]))]:
+        values = padded[index]
+        date_ordered_data[report_dates[date_index[index]]].append(StopRecord(
+            int(orders[index]),
+            float(latitudes[index]),
+            float(longitudes[index]),
+            values[4],
+            values[5],
+            values[6],
+            int(row_numbers[index])
+        ))
+
+    logger.info(f"Cleansed {count} rows: {len(valid_index)} valid, {len(error_rows)} sent to error rows.")
+    return date_ordered_data, error_rows
@@ -0,0 +1,139 @@
+# FILE: ML_Date_Index.py
+# VERSION: 0.02
+######################################
+# CHANGELOG
+######################################
+# 1. select_rows no longer copies the rows: with no period the list is returned as is.
+
+import calendar
+import logging
+import re
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import date
+from functions.Data_Ingest.ML_Data_Processing import parse_log_date
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# First (month, day) of a tax year. (1, 1) is the calendar year of a US return; the UK tax
+# year would be (4, 6). A tax year is named after the calendar year it starts in.
+TAX_YEAR_START = (1, 1)
+
+_MONTH_PATTERN = re.compile(r'^(\d{4})-(\d{1,2})$')
+_QUARTER_PATTERN = re.compile(r'^(\d{4})-?[Qq]([1-4])$')
+
+
+class DateRange:
+    # Inclusive range of log dates (datetime.date). A missing start or end leaves that side
+    # open. label names the period in log messages and report titles.
+
+    def __init__(self, start=None, end=None, label=None):
+        if start is not None and end is not None and start > end:
+            raise ValueError(f"Date range starts after it ends: {start} > {end}")
+        self.start = start
+        self.end = end
+        self.label = label or f"{start or '...'} to {end or '...'}"
+
+    def __contains__(self, day):
+        if day is None:
+            return False
+        return (self.start is None or day >= self.start) and (self.end is None or day <= self.end)
+
+    def __str__(self):
+        return self.label
+
+
+# Parse a YYYY-MM-DD command line date.
+def parse_iso_date(text):
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        raise ValueError(f"Invalid date {text!r}; expected YYYY-MM-DD") from None
+
+# One calendar month, written YYYY-MM.
+def month_range(text):
+    match = _MONTH_PATTERN.match(text.strip())
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        raise ValueError(f"Invalid month {text!r}; expected YYYY-MM")
+    year, month = int(match.group(1)), int(match.group(2))
+    return DateRange(date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1]), f"{year}-{month:02d}")
+
+# One calendar quarter, written YYYY-Q1 .. YYYY-Q4.
+def quarter_range(text):
+    match = _QUARTER_PATTERN.match(text.strip())
+    if not match:
+        raise ValueError(f"Invalid quarter {text!r}; expected YYYY-Q1 to YYYY-Q4")
+    year, quarter = int(match.group(1)), int(match.group(2))
+    last_month = quarter * 3
+    return DateRange(date(year, last_month - 2, 1), date(year, last_month, calendar.monthrange(year, last_month)[1]), f"{year}-Q{quarter}")
+
+# The tax year starting in the given calendar year, see TAX_YEAR_START.
+def tax_year_range(year, start=TAX_YEAR_START):
+    year = int(year)
+    first_day = date(year, *start)
+    last_day = date.fromordinal(date(year + 1, *start).toordinal() - 1)
+    label = f"tax year {year}" if start == (1, 1) else f"tax year {year}/{str(year + 1)[-2:]}"
+    return DateRange(first_day, last_day, label)
+
+# The report period selected by the command line options, or None for the whole log.
+# A month, quarter or tax year cannot be combined with each other or with start/end.
+def date_range_from_options(start=None, end=None, month=None, quarter=None, tax_year=None):
+    periods = [period for period in (month, quarter, tax_year) if period is not None]
+    if len(periods) > 1 or (periods and (start or end)):
+        raise ValueError("Choose one of a start/end range, a month, a quarter or a tax year.")
+    if month is not None:
+        return month_range(month)
+    if quarter is not None:
+        return quarter_range(quarter)
+    if tax_year is not None:
+        return tax_year_range(tax_year)
+    if start or end:
+        return DateRange(parse_iso_date(start) if start else None, parse_iso_date(end) if end else None)
+    return None
+
+
+# Sort date strings chronologically; strings that are not dates go last, in text order.
+def sort_log_dates(dates):
+    return sorted(dates, key=lambda text: (parse_log_date(text) or date.max, text))
+
+
+class DateIndex:
+    # Parsed-date index over the Date column of the sheet rows (SheetRow(row_number, values)).
+    # Each distinct date string is parsed once; the dates are kept sorted, so the rows of a
+    # period are found with two binary searches instead of parsing and testing every row.
+
+    def __init__(self, sheet_rows):
+        positions = defaultdict(list)
+        for position, sheet_row in enumerate(sheet_rows):
+            positions[sheet_row.values[0] if sheet_row.values else ''].append(position)
+
+        # Rows whose date does not parse belong to no period; cleansing reports them
+        self.unparsed = []
+        entries = []
+        for text, rows in positions.items():
+            parsed = parse_log_date(text)
+            if parsed is None:
+                self.unparsed.extend(rows)
+            else:
+                entries.append((parsed, rows))
+        entries.sort(key=lambda entry: entry[0])
+        self.dates = [parsed for parsed, _ in entries]
+        self.positions = [rows for _, rows in entries]
+
+    # Positions (in sheet order) of the rows dated within date_range, plus the rows without a valid date.
+    def select(self, date_range):
+        low = bisect_left(self.dates, date_range.start) if date_range.start is not None else 0
+        high = bisect_right(self.dates, date_range.end) if date_range.end is not None else len(self.dates)
+        selected = [position for rows in self.positions[low:high] for position in rows]
+        return sorted(selected + self.unparsed)
+
+
+# The sheet rows (a list of SheetRow) of a report period. Rows with an invalid date are kept
+# so they are still reported as error rows. With no date_range the list itself is returned.
+def select_rows(sheet_rows, date_range):
+    if date_range is None:
+        return sheet_rows
+    selected = [sheet_rows[position] for position in DateIndex(sheet_rows).select(date_range)]
+    logger.info(f"Report period {date_range}: {len(selected)} of {len(sheet_rows)} rows selected.")
+    return selected
@@ -0,0 +1,64 @@
+# FILE: ML_Stop_Record.py
+# VERSION: 0.02
+######################################
+# CHANGELOG
+######################################
+# 1. group_stops_by_date is removed: cleanse_rows (ML_Data_Processing) is the one grouping path.
+
+import logging
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Column positions in the mileage log
+DATE_COLUMN = 0
+ORDER_COLUMN = 1
+LATITUDE_COLUMN = 2
+LONGITUDE_COLUMN = 3
+BUSINESS_NAME_COLUMN = 4
+STREET_ADDRESS_COLUMN = 5
+PLACE_ID_COLUMN = 6
+
+
+class StopRecord:
+    # One parsed stop of a day. Uses __slots__ and keeps only the typed fields plus the
+    # sheet row number, instead of a tuple that also carried the full raw row list.
+    __slots__ = ('order', 'latitude', 'longitude', 'business_name', 'street_address', 'place_id', 'row_number')
+
+    def __init__(self, order, latitude, longitude, business_name, street_address, place_id, row_number=None):
+        self.order = order
+        self.latitude = latitude
+        self.longitude = longitude
+        self.business_name = business_name
+        self.street_address = street_address
+        self.place_id = place_id
+        self.row_number = row_number
+
+    # (lat, lng) pair as passed to the Maps functions.
+    @property
+    def coordinates(self):
+        return (self.latitude, self.longitude)
+
+    # Rebuild the sheet row of this stop, e.g. for error reporting.
+    def as_row(self, date):
+        return [date, str(self.order), str(self.latitude), str(self.longitude), self.business_name, self.street_address, self.place_id]
+
+    def __repr__(self):
+        return f"StopRecord(order={self.order}, latitude={self.latitude}, longitude={self.longitude}, business_name={self.business_name!r}, row_number={self.row_number})"
+
+
+# Parse one sheet row into (date, StopRecord). Raises ValueError or IndexError for rows
+# that cannot be parsed. A missing Place ID column is read as an empty Place ID.
+def parse_stop(values, row_number=None):
+    place_id = values[PLACE_ID_COLUMN] if len(values) > PLACE_ID_COLUMN else ''
+    stop = StopRecord(
+        int(values[ORDER_COLUMN]),
+        float(values[LATITUDE_COLUMN]),
+        float(values[LONGITUDE_COLUMN]),
+        values[BUSINESS_NAME_COLUMN],
+        values[STREET_ADDRESS_COLUMN],
+        place_id,
+        row_number
+    )
+    return values[DATE_COLUMN], stop
+
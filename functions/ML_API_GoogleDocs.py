@@ -1,7 +1,82 @@
 # FILE: ML_API_GoogleDocs.py
-# VERSION: 0.13
+# VERSION: 0.17
 #######################################
 # CHANGELOG
 #######################################
-# 1. Removed Google Docs output functions (moved to ML_output.py)
-# 2. Maintaining this file in the code base as a placeholder.
\ No newline at end of file
+# 1. The summary after the table lists the days flagged by the distance check, after the error rows and route errors.
+
+import logging
+from functions.Authentication.ML_API_Authentication import get_service, execute_request
+from functions.RENDER.ML_Render_HTML import REPORT_COLUMNS, REPORT_TITLE, REPORT_AUTHOR, cell_items
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Requests per documents().batchUpdate call when filling the table
+DOCS_BATCH_SIZE = 500
+
+# The Docs API service, built on first use.
+def _get_docs_service():
+    return get_service('docs', 'v1')
+
+# Execute a Docs API request through the shared rate limiter and run metrics.
+def _execute(endpoint, request):
+    return execute_request(f"docs.{endpoint}", request)
+
+# Create an empty Google Doc and return its document ID.
+def gDoc_create_new_doc(title):
+    logger.debug(f"Creating Google Doc: {title}")
+    document = _execute('documents.create', _get_docs_service().documents().create(body={'title': title}))
+    return document['documentId']
+
+# Plain-text table cells of the report: the headings, then one row per date.
+def _report_table_rows(target_data):
+    rows = [list(REPORT_COLUMNS)]
+    for row in target_data:
+        rows.append([row[0], f"{row[1]:.2f}", '\n'.join(cell_items(row[2])), '\n'.join(cell_items(row[3]))])
+    return rows
+
+# Text after the table: the total, the rows that could not be used and the days whose API
+# miles failed the distance check.
+def _report_summary(target_data, error_rows, route_errors, distance_flags=None):
+    lines = [f"\nTotal Miles Driven: {sum(row[1] for row in target_data):.2f}\n"]
+    if error_rows:
+        lines.append("\nError Rows\n")
+        lines.extend(f"Row skipped during cleansing: {row}\n" for row in error_rows)
+    if route_errors:
+        lines.append("\nRoute Errors\n")
+        lines.extend(f"No route found for row: {row}\n" for row in route_errors)
+    if distance_flags:
+        lines.append("\nDistance Check\n")
+        lines.extend(f"{date}: {api:.2f} API miles vs {estimate:.2f} estimated miles; check the waypoints\n"
+                     for date, api, estimate in distance_flags)
+    return ''.join(lines)
+
+# Write the report to doc_id as a title, a table with one row per date, the total, the error rows
+# and the distance check flags.
+# The table is inserted empty, then its cells are filled from the last cell backwards so the
+# start indices read back from the document stay valid while text is inserted.
+def gDoc_create_and_populate_table(doc_id, target_data, error_rows, route_errors, distance_flags=None):
+    logger.debug(f"Writing {len(target_data)} rows to Google Doc ID: {doc_id}")
+    documents = _get_docs_service().documents()
+    rows = _report_table_rows(target_data)
+
+    requests = [
+        {'insertText': {'location': {'index': 1}, 'text': f"{REPORT_TITLE} ({REPORT_AUTHOR})\n"}},
+        {'insertTable': {'rows': len(rows), 'columns': len(REPORT_COLUMNS), 'endOfSegmentLocation': {'segmentId': ''}}},
+    ]
+    _execute('documents.batchUpdate', documents.batchUpdate(documentId=doc_id, body={'requests': requests}))
+
+    document = _execute('documents.get', documents.get(documentId=doc_id))
+    table = next(element['table'] for element in document['body']['content'] if 'table' in element)
+    requests = []
+    for table_row, values in zip(table['tableRows'], rows):
+        for table_cell, text in zip(table_row['tableCells'], values):
+            if text:
+                requests.append({'insertText': {'location': {'index': table_cell['content'][0]['startIndex']}, 'text': text}})
+    requests.reverse()
+    requests.append({'insertText': {'endOfSegmentLocation': {'segmentId': ''}, 'text': _report_summary(target_data, error_rows, route_errors, distance_flags)}})
+
+    for start in range(0, len(requests), DOCS_BATCH_SIZE):
+        _execute('documents.batchUpdate', documents.batchUpdate(documentId=doc_id, body={'requests': requests[start:start + DOCS_BATCH_SIZE]}))
+    logger.debug(f"Data written to Google Doc: {doc_id}")
@@ -0,0 +1,30 @@
+# FILE: ML_API_GoogleDrive.py
+# VERSION: 0.02
+#######################################
+# CHANGELOG
+#######################################
+# 1. Requests go through execute_request: they share the rate limiter budget and are retried when throttled.
+
+import logging
+import os
+from functions.Authentication.ML_API_Authentication import get_service, execute_request
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Optional override of the Drive API endpoint, e.g. http://127.0.0.1:8765/drive/v3/
+DRIVE_API_ENDPOINT = os.environ.get('ML_DRIVE_API_ENDPOINT')
+
+# Execute a Drive API request through the shared rate limiter and run metrics.
+def _execute(endpoint, request):
+    return execute_request(f"drive.{endpoint}", request)
+
+# Return the current revision of a Drive file as "version@modifiedTime". The version grows
+# with every change to the file, so the revision changes whenever any tab of a spreadsheet
+# is edited. This is a metadata-only request: no cell values are downloaded.
+def get_file_revision(file_id):
+    files = get_service('drive', 'v3', api_endpoint=DRIVE_API_ENDPOINT).files()
+    metadata = _execute('files.get', files.get(fileId=file_id, fields='version,modifiedTime', supportsAllDrives=True))
+    revision = f"{metadata.get('version', '')}@{metadata.get('modifiedTime', '')}"
+    logger.debug(f"Revision of {file_id}: {revision}")
+    return revision
@@ -1,15 +1,268 @@
 # FILE: ML_API_GoogleMaps.py
-# VERSION: 0.16
+# VERSION: 0.26
 #######################################
 # CHANGELOG
 #######################################
-# 1. Updated get_route_distance function to extract total distance from Directions API response
-# 2. Renamed function for better descriptiveness
+# 1. MapsClient no longer keeps its own list of every latency sample (it grew for the life of the process,
+#    e.g. in watch mode); attempt latencies are only recorded in the per-run metrics.
 
 import logging
-import requests
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functions.ML_Cache import get_route_cache, get_leg_store
+from functions.ML_Metrics import get_metrics
+from functions.ML_Rate_Limiter import get_rate_limiter
 from secret.ML_config import ROUTES_API_KEY
 
+# Travel options sent to the Directions API; part of the route cache key
+TRAVEL_OPTIONS = {'mode': 'driving'}
+
+METERS_TO_MILES = 0.000621371
+
+# Maps API endpoints
+MAPS_API_BASE = os.environ.get('ML_MAPS_API_BASE', 'https://maps.googleapis.com/maps/api')
+DIRECTIONS_ENDPOINT = 'directions'
+GEOCODE_ENDPOINT = 'geocode'
+
+# HTTP client settings
+MAPS_TIMEOUT = (5, 30)          # (connect, read) seconds
+MAPS_MAX_RETRIES = 5
+MAPS_BACKOFF_BASE = 0.5         # seconds, doubled on every retry
+MAPS_BACKOFF_MAX = 30           # seconds
+MAPS_POOL_SIZE = 16
+
+# Directions accepts at most 25 waypoints besides origin and destination; longer days are
+# split into segments that share their boundary stop
+MAX_WAYPOINTS = 25
+SEGMENT_WORKERS = 4
+
+# Google Maps itinerary URLs accept at most 9 waypoints
+MAP_LINK_MAX_WAYPOINTS = 9
+
+# Statuses worth retrying: HTTP codes for throttling/server errors and the API-level equivalents
+RETRYABLE_HTTP_STATUSES = {429, 500, 502, 503, 504}
+RETRYABLE_API_STATUSES = {'OVER_QUERY_LIMIT', 'UNKNOWN_ERROR'}
+
+# Statuses meaning the request went over quota; they slow the shared rate limiter down
+THROTTLE_HTTP_STATUSES = {429}
+THROTTLE_API_STATUSES = {'OVER_QUERY_LIMIT'}
+
+
+class MapsAPIError(Exception):
+    # Raised when a Maps API call fails for good (non-retryable status or retries exhausted).
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class MapsClient:
+    # Shared HTTP client for the Maps web services. One pooled session keeps connections
+    # alive between calls; every attempt waits for the endpoint's rate limiter budget,
+    # transient failures are retried with exponential backoff and full jitter, and the
+    # latency of every HTTP attempt is recorded in the run metrics.
+
+    def __init__(self, api_key=ROUTES_API_KEY, base_url=MAPS_API_BASE, timeout=MAPS_TIMEOUT, max_retries=MAPS_MAX_RETRIES,
+                 backoff_base=MAPS_BACKOFF_BASE, backoff_max=MAPS_BACKOFF_MAX, pool_size=MAPS_POOL_SIZE):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self._transient_errors = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                                  requests.exceptions.ContentDecodingError)
+        self._request_error = requests.RequestException
+
+    # Record how long one HTTP attempt against an endpoint took and how it ended.
+    def _record_latency(self, endpoint, seconds, status):
+        get_metrics().record_api_call(f"maps.{endpoint}", status, seconds)
+
+    # Sleep before retry number `attempt` (0-based): exponential backoff with full jitter.
+    def _backoff(self, endpoint, attempt, reason):
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        logging.warning(f"Maps {endpoint} call failed ({reason}); retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries}).")
+        time.sleep(delay)
+
+    # GET a Maps JSON endpoint and return the decoded payload. Retryable HTTP and API
+    # statuses, dropped connections and bodies that are not JSON are retried; other API
+    # statuses are returned for the caller to interpret. Failures raise MapsAPIError.
+    def get_json(self, endpoint, params):
+        url = f"{self.base_url}/{endpoint}/json"
+        query = dict(params, key=self.api_key)
+        limiter = get_rate_limiter()
+        budget = f"maps.{endpoint}"
+        reason = None
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._backoff(endpoint, attempt - 1, reason)
+
+            limiter.acquire(budget)
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, params=query, timeout=self.timeout)
+            except self._transient_errors as error:
+                reason = type(error).__name__
+                self._record_latency(endpoint, time.perf_counter() - started, reason)
+                continue
+            except self._request_error as error:
+                self._record_latency(endpoint, time.perf_counter() - started, type(error).__name__)
+                raise MapsAPIError(f"Maps {endpoint} call failed: {error}", type(error).__name__) from error
+            elapsed = time.perf_counter() - started
+
+            if response.status_code in RETRYABLE_HTTP_STATUSES:
+                reason = f"HTTP {response.status_code}"
+                self._record_latency(endpoint, elapsed, response.status_code)
+                if response.status_code in THROTTLE_HTTP_STATUSES:
+                    limiter.throttled(budget)
+                continue
+            if response.status_code != 200:
+                self._record_latency(endpoint, elapsed, response.status_code)
+                raise MapsAPIError(f"Maps {endpoint} call failed with HTTP {response.status_code}", response.status_code)
+
+            try:
+                payload = response.json()
+            except ValueError:
+                reason = 'invalid JSON'
+                self._record_latency(endpoint, elapsed, reason)
+                continue
+            status = payload.get('status') if isinstance(payload, dict) else None
+            self._record_latency(endpoint, elapsed, status)
+            if status in RETRYABLE_API_STATUSES:
+                reason = status
+                if status in THROTTLE_API_STATUSES:
+                    limiter.throttled(budget)
+                continue
+            limiter.succeeded(budget)
+            return payload
+
+        raise MapsAPIError(f"Maps {endpoint} call failed after {self.max_retries} retries: {reason}", reason)
+
+    # Directions API request for an ordered origin/waypoints/destination route.
+    def directions(self, origin, destination, waypoints, mode=TRAVEL_OPTIONS['mode']):
+        params = {'origin': origin, 'destination': destination, 'mode': mode}
+        if waypoints:
+            params['waypoints'] = waypoints
+        return self.get_json(DIRECTIONS_ENDPOINT, params)
+
+    # Reverse geocoding request for a latitude/longitude pair.
+    def geocode(self, latitude, longitude):
+        return self.get_json(GEOCODE_ENDPOINT, {'latlng': f"{latitude},{longitude}"})
+
+
+_maps_client = None
+_maps_client_lock = threading.Lock()
+
+
+# Shared Maps client for the process; created on first use.
+def get_maps_client():
+    global _maps_client
+    with _maps_client_lock:
+        if _maps_client is None:
+            _maps_client = MapsClient()
+        return _maps_client
+
+
+# Split an ordered list of points into overlapping segments of at most max_waypoints + 2
+# points. Consecutive segments share one point, so the legs of all segments concatenate
+# into exactly the legs of the full route.
+def _split_into_segments(points, max_waypoints):
+    segment_size = max_waypoints + 2
+    segments = []
+    start = 0
+    while True:
+        segments.append(points[start:start + segment_size])
+        if start + segment_size >= len(points):
+            return segments
+        start += segment_size - 1
+
+
+# Build the Google Maps itinerary link for an ordered list of locations. Days with more
+# stops than one link can hold get one link per segment, separated by spaces.
+def _build_map_link(locations):
+    links = []
+    for segment in _split_into_segments(locations, MAP_LINK_MAX_WAYPOINTS):
+        origin = f"{segment[0][0]},{segment[0][1]}"
+        destination = f"{segment[-1][0]},{segment[-1][1]}"
+        waypoints = '|'.join([f"{lat},{lng}" for lat, lng in segment[1:-1]])
+        links.append(f"https://www.google.com/maps/dir/?api=1&origin={origin}&destination={destination}&waypoints={waypoints}&travelmode=driving")
+    return ' '.join(links)
+
+
+# Request one Directions route through the given points (within the waypoint limit) and
+# return its legs as (distance_meters, end_address) per consecutive pair, or None when
+# Google finds no route.
+def _fetch_segment_legs(points, debug_mileage):
+    origin = f"{points[0][0]},{points[0][1]}"
+    destination = f"{points[-1][0]},{points[-1][1]}"
+    waypoints = '|'.join([f"{lat},{lng}" for lat, lng in points[1:-1]])
+    
+    if debug_mileage:
+        logging.debug(f"Directions API request: origin={origin} destination={destination} waypoints={waypoints}")
+    
+    directions = get_maps_client().directions(origin, destination, waypoints)
+    
+    if debug_mileage:
+        logging.debug(f"Directions API response: {directions}")
+    
+    if directions['status'] == 'ZERO_RESULTS':
+        logging.warning(f"No route found for locations: {points}")
+        return None
+    elif directions['status'] != 'OK':
+        logging.error(f"Error fetching route: {directions['status']}")
+        raise MapsAPIError(f"Error fetching route: {directions['status']}", directions['status'])
+    
+    legs = directions['routes'][0]['legs']
+    return [(leg['distance']['value'], leg['end_address']) for leg in legs]
+
+
+# Resolve the legs of a route of any length. Routes beyond the waypoint limit are split
+# into overlapping segments, resolved concurrently and stitched back in order. Returns
+# None if any segment has no route.
+def _fetch_route_legs(points, debug_mileage):
+    segments = _split_into_segments(points, MAX_WAYPOINTS)
+    if len(segments) == 1:
+        return _fetch_segment_legs(points, debug_mileage)
+    
+    if debug_mileage:
+        logging.debug(f"Route with {len(points)} stops split into {len(segments)} segments")
+    
+    with ThreadPoolExecutor(max_workers=min(SEGMENT_WORKERS, len(segments)), thread_name_prefix='segment') as executor:
+        segment_legs = list(executor.map(lambda segment: _fetch_segment_legs(segment, debug_mileage), segments))
+    
+    if any(legs is None for legs in segment_legs):
+        return None
+    return [leg for legs in segment_legs for leg in legs]
+
+
+# Group the indexes of unknown legs into contiguous (first_leg, last_leg) runs, so each run
+# can be requested as one route through locations[first_leg:last_leg + 2].
+def _missing_leg_runs(leg_count, known_legs):
+    runs = []
+    start = None
+    for index in range(leg_count):
+        if index in known_legs:
+            if start is not None:
+                runs.append((start, index - 1))
+                start = None
+        elif start is None:
+            start = index
+    if start is not None:
+        runs.append((start, leg_count - 1))
+    return runs
+
+
 def gMap_extract_distance_from_directions(locations, debug_mileage):
     if debug_mileage:
         logging.debug(f"Calculating route distance for locations: {locations}")
@@ -17,35 +270,54 @@ def gMap_extract_distance_from_directions(locations, debug_mileage):
     if len(locations) < 2:
         return 0, [], ""
     
-    origin = f"{locations[0][0]},{locations[0][1]}"
-    destination = f"{locations[-1][0]},{locations[-1][1]}"
-    waypoints = '|'.join([f"{lat},{lng}" for lat, lng in locations[1:-1]])
+    # Historical routes never change, so look in the persistent cache first
+    route_cache = get_route_cache()
+    cached = route_cache.get(locations, TRAVEL_OPTIONS)
+    if cached is not None:
+        leg_distances, end_addresses, map_link = cached
+        total_distance = sum(leg_distances) * METERS_TO_MILES
+        if debug_mileage:
+            logging.debug(f"Route cache hit. Total distance: {total_distance} miles")
+        return round(total_distance, 2), end_addresses, map_link
     
-    url = f"https://maps.googleapis.com/maps/api/directions/json?origin={origin}&destination={destination}&waypoints={waypoints}&key={ROUTES_API_KEY}"
+    # Known stop pairs come from the leg store; only the unknown legs go to the API
+    leg_store = get_leg_store()
+    legs = leg_store.get_legs(locations, TRAVEL_OPTIONS)
+    missing_runs = _missing_leg_runs(len(locations) - 1, legs)
     
     if debug_mileage:
-        logging.debug(f"Directions API URL: {url}")
+        logging.debug(f"Leg store: {len(legs)} of {len(locations) - 1} legs known, {len(missing_runs)} request(s) needed")
+    
+    for first_leg, last_leg in missing_runs:
+        points = locations[first_leg:last_leg + 2]
+        fetched = _fetch_route_legs(points, debug_mileage)
+        if fetched is None:
+            return 0, [], ""
+        leg_store.put_legs(points, fetched, TRAVEL_OPTIONS)
+        for offset, leg in enumerate(fetched):
+            legs[first_leg + offset] = leg
     
-    response = requests.get(url)
-    directions = response.json()
+    leg_distances = [legs[index][0] for index in range(len(locations) - 1)]
+    end_addresses = [legs[index][1] for index in range(len(locations) - 1)]
+    total_distance = sum(leg_distances) * METERS_TO_MILES  # Convert meters to miles
     
     if debug_mileage:
-        logging.debug(f"Directions API response: {directions}")
+        logging.debug(f"Total distance: {total_distance} miles")
     
-    if directions['status'] == 'ZERO_RESULTS':
-        logging.warning(f"No route found for locations: {locations}")
-        return 0, [], ""
-    elif directions['status'] != 'OK':
-        logging.error(f"Error fetching route: {directions['status']}")
-        raise Exception(f"Error fetching route: {directions['status']}")
+    map_link = _build_map_link(locations)
     
-    route = directions['routes'][0]
-    legs = route['legs']
-    total_distance = sum(leg['distance']['value'] for leg in legs) * 0.000621371  # Convert meters to miles
+    route_cache.put(locations, leg_distances, end_addresses, map_link, TRAVEL_OPTIONS)
     
-    if debug_mileage:
-        logging.debug(f"Total distance: {total_distance} miles")
+    return round(total_distance, 2), end_addresses, map_link
+
+
+# Get the Place ID of the location at the given coordinates (reverse geocoding).
+# Returns an empty string when Google has no match.
+def get_place_id(latitude, longitude):
+    result = get_maps_client().geocode(latitude, longitude)
     
-    map_link = f"https://www.google.com/maps/dir/?api=1&origin={origin}&destination={destination}&waypoints={waypoints}&travelmode=driving"
+    if result['status'] == 'OK':
+        return result['results'][0]['place_id']
     
-    return round(total_distance, 2), [leg['end_address'] for leg in legs], map_link
\ No newline at end of file
+    logging.warning(f"Failed to get Place ID for coordinates ({latitude}, {longitude}): {result['status']}")
+    return ""
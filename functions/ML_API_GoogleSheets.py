@@ -1,42 +1,217 @@
 # FILE: ML_API_GoogleSheets.py
-# VERSION: 0.02
+# VERSION: 0.13
 #######################################
 # CHANGELOG
 #######################################
-# 1. Updated file header format
+# 1. iter_sheet_rows always reads from row 1: the unused start_row parameter is removed. read_sheet_rows
+#    builds the one list of SheetRow that the rest of the pipeline shares.
 
 import logging
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
-from secret.ML_config import SERVICE_ACCOUNT_FILE, SPREADSHEET_ID
+import os
+from collections import namedtuple
+from datetime import datetime
+from functions.Authentication.ML_API_Authentication import get_service, execute_request
+from functions.ML_API_GoogleDrive import get_file_revision
+from functions.ML_Cache import get_sheet_snapshot_cache
+from secret.ML_config import SPREADSHEET_ID
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-# Authentication
-credentials = service_account.Credentials.from_service_account_file(
-    SERVICE_ACCOUNT_FILE,
-    scopes=['https://www.googleapis.com/auth/spreadsheets']
-)
+# Columns of the mileage log (Date, Order, Latitude, Longitude, Business Name, Street Address, Place ID)
+SHEET_FIRST_COLUMN = 'A'
+SHEET_LAST_COLUMN = 'G'
 
-sheets_service = build('sheets', 'v4', credentials=credentials, cache_discovery=False)
+# Paginated reads: rows per block and blocks per batchGet request
+READ_BLOCK_ROWS = 1000
+READ_BLOCKS_PER_REQUEST = 5
+
+# One row of a sheet with its 1-based sheet row number
+SheetRow = namedtuple('SheetRow', ['row_number', 'values'])
+
+# Optional override of the Sheets API endpoint, e.g. http://127.0.0.1:8765/
+SHEETS_API_ENDPOINT = os.environ.get('ML_SHEETS_API_ENDPOINT')
+
+# The spreadsheets() resource of the Sheets service, authenticated on first use.
+def _spreadsheets():
+    return get_service('sheets', 'v4', api_endpoint=SHEETS_API_ENDPOINT).spreadsheets()
+
+# Execute a Sheets API request through the shared rate limiter and run metrics.
+def _execute(endpoint, request):
+    return execute_request(f"sheets.{endpoint}", request)
 
 def read_sheet(sheet_name):
     logger.debug(f"Reading data from sheet: {sheet_name}")
-    result = sheets_service.spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID, range=sheet_name).execute()
+    result = _execute('values.get', _spreadsheets().values().get(spreadsheetId=SPREADSHEET_ID, range=sheet_name))
     logger.debug(f"Data read from sheet {sheet_name}: {result}")
     return result.get('values', [])
 
+# Number of rows in the grid of a tab; no values exist below it. Metadata only, no cell values.
+def get_sheet_row_count(sheet_name):
+    title = sheet_name.split('!')[0].strip("'").replace("''", "'")
+    result = _execute('get', _spreadsheets().get(spreadsheetId=SPREADSHEET_ID, fields='sheets.properties(title,gridProperties.rowCount)'))
+    for sheet in result.get('sheets', []):
+        properties = sheet.get('properties', {})
+        if properties.get('title') == title:
+            return properties.get('gridProperties', {}).get('rowCount', 0)
+    raise ValueError(f"Sheet {title} not found in spreadsheet {SPREADSHEET_ID}")
+
+# Stream the rows of a sheet, reading only first_column:last_column in blocks of block_rows
+# rows (several blocks per values().batchGet request). Rows are yielded lazily as
+# SheetRow(row_number, values), so no response holds more than one request's blocks. The API trims trailing blank rows from each block, so a short block
+# does not mark the end of the data: reading continues to the tab's grid row count.
+def iter_sheet_rows(sheet_name, first_column=SHEET_FIRST_COLUMN, last_column=SHEET_LAST_COLUMN,
+                    block_rows=READ_BLOCK_ROWS, blocks_per_request=READ_BLOCKS_PER_REQUEST):
+    tab_name = sheet_name.split('!')[0]
+    row_count = get_sheet_row_count(sheet_name)
+    next_row = 1
+
+    while next_row <= row_count:
+        block_starts = [block_start for block_start in (next_row + block * block_rows for block in range(blocks_per_request))
+                        if block_start <= row_count]
+        ranges = [f"{tab_name}!{first_column}{block_start}:{last_column}{block_start + block_rows - 1}" for block_start in block_starts]
+        logger.debug(f"Reading sheet blocks: {ranges[0]} .. {ranges[-1]}")
+        result = _execute('values.batchGet', _spreadsheets().values().batchGet(
+            spreadsheetId=SPREADSHEET_ID,
+            ranges=ranges,
+            majorDimension='ROWS'
+        ))
+
+        value_ranges = result.get('valueRanges', [])
+        for block_start, value_range in zip(block_starts, value_ranges):
+            for offset, values in enumerate(value_range.get('values', [])):
+                yield SheetRow(block_start + offset, values)
+
+        next_row = block_starts[-1] + block_rows
+
+# Read all rows of a sheet as a list of SheetRow. This list is the only copy of the rows the
+# pipeline keeps: selection and cleansing take it as is. The whole sheet is held in memory on
+# purpose: the snapshot is keyed by revision and any cell may change between revisions (Place
+# IDs are written back into existing rows), so rows cannot be read incrementally. A cheap Drive metadata request gives the
+# spreadsheet's current revision; if a snapshot of this range was saved at that revision it is
+# returned without downloading any values, otherwise the sheet is read with iter_sheet_rows and
+# the snapshot replaced. The revision is taken before the values are read, so an edit made
+# during the read only causes one extra download next time. refresh=True always downloads.
+# If the revision cannot be read (e.g. no network), offline runs use the last snapshot of the
+# range whatever its revision; online runs read the sheet without the snapshot cache.
+def read_sheet_rows(sheet_name, refresh=False, first_column=SHEET_FIRST_COLUMN, last_column=SHEET_LAST_COLUMN, offline=False):
+    range_key = f"{sheet_name.split('!')[0]}!{first_column}:{last_column}"
+    snapshot_cache = get_sheet_snapshot_cache()
+    try:
+        revision = get_file_revision(SPREADSHEET_ID)
+    except Exception as error:
+        latest = snapshot_cache.get_latest(SPREADSHEET_ID, range_key) if offline else None
+        if latest is not None:
+            saved_revision, snapshot, saved_at = latest
+            logger.warning(f"Could not read the spreadsheet revision ({error}); offline run uses the snapshot of {sheet_name} "
+                           f"saved {datetime.fromtimestamp(saved_at):%Y-%m-%d %H:%M} (revision {saved_revision}), which may be out of date.")
+            return [SheetRow(row_number, values) for row_number, values in snapshot]
+        logger.warning(f"Could not read the spreadsheet revision ({error}); reading {sheet_name} without the snapshot cache.")
+        return list(iter_sheet_rows(sheet_name, first_column=first_column, last_column=last_column))
+
+    if not refresh:
+        snapshot = snapshot_cache.get(SPREADSHEET_ID, range_key, revision)
+        if snapshot is not None:
+            logger.info(f"Sheet {sheet_name} unchanged since revision {revision}; using the local snapshot.")
+            return [SheetRow(row_number, values) for row_number, values in snapshot]
+
+    rows = list(iter_sheet_rows(sheet_name, first_column=first_column, last_column=last_column))
+    snapshot_cache.put(SPREADSHEET_ID, range_key, revision, rows)
+    return rows
+
 def write_sheet(sheet_name, data):
     logger.debug(f"Writing data to sheet: {sheet_name}")
     body = {
         'values': data
     }
-    result = sheets_service.spreadsheets().values().update(
+    result = _execute('values.update', _spreadsheets().values().update(
         spreadsheetId=SPREADSHEET_ID,
         range=sheet_name,
         valueInputOption='RAW',
         body=body
-    ).execute()
+    ))
     logger.debug(f"Data written to sheet {sheet_name}: {result}")
-    return result
\ No newline at end of file
+    return result
+
+# Clear the values of a sheet (formatting is kept), e.g. before rewriting a report tab.
+def clear_sheet(sheet_name):
+    logger.debug(f"Clearing sheet: {sheet_name}")
+    return _execute('values.clear', _spreadsheets().values().clear(
+        spreadsheetId=SPREADSHEET_ID,
+        range=sheet_name,
+        body={}
+    ))
+
+# Convert a 0-based column index to its A1 column letters (0 -> A, 26 -> AA).
+def _column_letter(index):
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+# Compare the rows originally read from a sheet with their updated version and return the
+# changed cells as batchUpdate value ranges. Changed cells next to each other in a row are
+# merged, and identical column spans on consecutive rows are merged into one block.
+# first_row is the sheet row number of rows[0] (1 when the read started at A1).
+def diff_sheet_ranges(sheet_name, original_rows, updated_rows, first_row=1):
+    tab_name = sheet_name.split('!')[0]
+    if not tab_name.startswith("'") and not tab_name.replace('_', '').isalnum():
+        tab_name = "'" + tab_name.replace("'", "''") + "'"
+
+    # Runs of changed cells per row: (row_index, first_col, last_col)
+    runs = []
+    for row_index, updated in enumerate(updated_rows):
+        original = original_rows[row_index] if row_index < len(original_rows) else []
+        start = None
+        width = max(len(original), len(updated))
+        for col in range(width + 1):
+            changed = col < width and (original[col] if col < len(original) else '') != (updated[col] if col < len(updated) else '')
+            if changed and start is None:
+                start = col
+            elif not changed and start is not None:
+                runs.append((row_index, start, col - 1))
+                start = None
+
+    # Merge runs covering the same columns on consecutive rows into rectangular blocks
+    blocks = []
+    for row_index, first_col, last_col in runs:
+        if blocks:
+            block = blocks[-1]
+            if block['first_col'] == first_col and block['last_col'] == last_col and block['last_row'] == row_index - 1:
+                block['last_row'] = row_index
+                continue
+        blocks.append({'first_row': row_index, 'last_row': row_index, 'first_col': first_col, 'last_col': last_col})
+
+    value_ranges = []
+    for block in blocks:
+        values = []
+        for row_index in range(block['first_row'], block['last_row'] + 1):
+            updated = updated_rows[row_index]
+            values.append([updated[col] if col < len(updated) else '' for col in range(block['first_col'], block['last_col'] + 1)])
+        start_cell = f"{_column_letter(block['first_col'])}{first_row + block['first_row']}"
+        end_cell = f"{_column_letter(block['last_col'])}{first_row + block['last_row']}"
+        value_ranges.append({'range': f"{tab_name}!{start_cell}:{end_cell}", 'values': values})
+    return value_ranges
+
+# Write back only the cells that differ between original_rows (as read) and updated_rows.
+# original_rows must be a copy taken before the rows were modified in place, and both
+# lists must line up row for row (skipped rows stay in place rather than being dropped).
+def write_sheet_changes(sheet_name, original_rows, updated_rows, first_row=1):
+    value_ranges = diff_sheet_ranges(sheet_name, original_rows, updated_rows, first_row)
+    if not value_ranges:
+        logger.debug(f"No changes to write to sheet: {sheet_name}")
+        return None
+
+    logger.debug(f"Writing {len(value_ranges)} changed range(s) to sheet: {sheet_name}")
+    body = {
+        'valueInputOption': 'RAW',
+        'data': value_ranges
+    }
+    result = _execute('values.batchUpdate', _spreadsheets().values().batchUpdate(
+        spreadsheetId=SPREADSHEET_ID,
+        body=body
+    ))
+    logger.debug(f"Changed cells written to sheet {sheet_name}: {result}")
+    return result
@@ -0,0 +1,353 @@
+# FILE: ML_Cache.py
+# VERSION: 0.06
+######################################
+# CHANGELOG
+######################################
+# 1. SheetSnapshotCache.get_latest returns the last snapshot of a range whatever its revision, for runs that cannot reach Google.
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from functions.ML_Metrics import get_metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Cache location and limits
+CACHE_DIR = 'cache'
+ROUTE_CACHE_FILE = os.path.join(CACHE_DIR, 'ML_route_cache.sqlite3')
+ROUTE_CACHE_TTL_DAYS = 365
+ROUTE_CACHE_MAX_ENTRIES = 20000
+LEG_STORE_FILE = os.path.join(CACHE_DIR, 'ML_leg_store.sqlite3')
+GEOCODE_CACHE_FILE = os.path.join(CACHE_DIR, 'ML_geocode_cache.sqlite3')
+GEOCODE_CACHE_TTL_DAYS = 365
+SHEET_SNAPSHOT_FILE = os.path.join(CACHE_DIR, 'ML_sheet_snapshots.sqlite3')
+
+# Number of decimals kept when normalizing coordinates (~0.1 m precision)
+COORDINATE_PRECISION = 6
+
+
+# Normalize an ordered list of (lat, lng) pairs into a stable string so that
+# "34.1", "34.10" and 34.100000 all map to the same cache key.
+def normalize_coordinates(locations):
+    return '|'.join(f"{float(lat):.{COORDINATE_PRECISION}f},{float(lng):.{COORDINATE_PRECISION}f}" for lat, lng in locations)
+
+
+# Normalize a single (lat, lng) pair the same way as normalize_coordinates.
+def normalize_point(point):
+    return normalize_coordinates([point])
+
+
+# Build the cache key from the ordered coordinates plus any travel options
+# (mode, avoid, ...) that change the route Google returns.
+def make_route_key(locations, options=None):
+    options = options or {}
+    option_text = '&'.join(f"{name}={options[name]}" for name in sorted(options))
+    return f"{normalize_coordinates(locations)}#{option_text}"
+
+
+# Open (and create if needed) a SQLite database under the cache directory.
+def _open_database(db_path):
+    directory = os.path.dirname(db_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(db_path, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+class RouteCache:
+    # Persistent route cache keyed on the normalized coordinate list and travel options.
+    # Only the per-leg distances (meters), leg end addresses and the map link are stored.
+    # Entries expire after ttl_days and the least recently used entries are evicted once
+    # the cache grows past max_entries.
+
+    def __init__(self, db_path=ROUTE_CACHE_FILE, ttl_days=ROUTE_CACHE_TTL_DAYS, max_entries=ROUTE_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = _open_database(db_path)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS routes (
+                route_key TEXT PRIMARY KEY,
+                leg_distances TEXT NOT NULL,
+                end_addresses TEXT NOT NULL,
+                map_link TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        self._connection.execute('CREATE INDEX IF NOT EXISTS idx_routes_last_access ON routes (last_access)')
+        self._connection.commit()
+
+    # Return (leg_distances, end_addresses, map_link) for a cached route, or None on a miss.
+    def get(self, locations, options=None):
+        key = make_route_key(locations, options)
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT leg_distances, end_addresses, map_link, created_at FROM routes WHERE route_key = ?',
+                (key,)
+            ).fetchone()
+            if row is None:
+                get_metrics().record_cache('route', misses=1)
+                return None
+            leg_distances, end_addresses, map_link, created_at = row
+            if self.ttl_seconds and now - created_at > self.ttl_seconds:
+                logger.debug(f"Route cache entry expired: {key}")
+                self._connection.execute('DELETE FROM routes WHERE route_key = ?', (key,))
+                self._connection.commit()
+                get_metrics().record_cache('route', misses=1)
+                return None
+            self._connection.execute('UPDATE routes SET last_access = ? WHERE route_key = ?', (now, key))
+            self._connection.commit()
+        get_metrics().record_cache('route', hits=1)
+        return json.loads(leg_distances), json.loads(end_addresses), map_link
+
+    # Store a resolved route and evict the least recently used entries if over the size limit.
+    def put(self, locations, leg_distances, end_addresses, map_link, options=None):
+        key = make_route_key(locations, options)
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO routes (route_key, leg_distances, end_addresses, map_link, created_at, last_access) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, json.dumps(leg_distances), json.dumps(end_addresses), map_link, now, now)
+            )
+            self._evict()
+            self._connection.commit()
+
+    # Drop expired entries, then the least recently used ones beyond max_entries.
+    def _evict(self):
+        if self.ttl_seconds:
+            self._connection.execute('DELETE FROM routes WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+        if self.max_entries:
+            count = self._connection.execute('SELECT COUNT(*) FROM routes').fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                logger.debug(f"Route cache over limit, evicting {overflow} least recently used entries.")
+                self._connection.execute(
+                    'DELETE FROM routes WHERE route_key IN (SELECT route_key FROM routes ORDER BY last_access ASC LIMIT ?)',
+                    (overflow,)
+                )
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class LegStore:
+    # Leg-level distance store keyed on (origin, destination) coordinate pairs and travel
+    # options. Crews revisit the same places, so most legs of a new day are already known
+    # from earlier Directions responses. Legs do not expire: road distance between two
+    # fixed points is stable enough for mileage reporting.
+
+    def __init__(self, db_path=LEG_STORE_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = _open_database(db_path)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS legs (
+                origin TEXT NOT NULL,
+                destination TEXT NOT NULL,
+                options TEXT NOT NULL,
+                distance INTEGER NOT NULL,
+                end_address TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (origin, destination, options)
+            )
+            """
+        )
+        self._connection.commit()
+
+    # Return {index: (distance_meters, end_address)} for the known consecutive legs of a route.
+    def get_legs(self, locations, options=None):
+        option_text = make_route_key([], options)
+        points = [normalize_point(point) for point in locations]
+        known = {}
+        with self._lock:
+            for index in range(len(points) - 1):
+                row = self._connection.execute(
+                    'SELECT distance, end_address FROM legs WHERE origin = ? AND destination = ? AND options = ?',
+                    (points[index], points[index + 1], option_text)
+                ).fetchone()
+                if row is not None:
+                    known[index] = (row[0], row[1])
+        get_metrics().record_cache('leg', hits=len(known), misses=len(points) - 1 - len(known))
+        return known
+
+    # Store the legs of a resolved route: legs is a list of (distance_meters, end_address)
+    # for each consecutive pair of locations.
+    def put_legs(self, locations, legs, options=None):
+        option_text = make_route_key([], options)
+        points = [normalize_point(point) for point in locations]
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO legs (origin, destination, options, distance, end_address, updated_at) VALUES (?, ?, ?, ?, ?, ?)',
+                [(points[index], points[index + 1], option_text, distance, end_address, now) for index, (distance, end_address) in enumerate(legs)]
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class GeocodeCache:
+    # Persistent reverse-geocoding cache: normalized (lat, lng) -> Place ID. Empty Place IDs
+    # (no match) are cached too so the same unmatched coordinates are not looked up again
+    # until the entry expires.
+
+    def __init__(self, db_path=GEOCODE_CACHE_FILE, ttl_days=GEOCODE_CACHE_TTL_DAYS):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_days * 86400
+        self._lock = threading.Lock()
+        self._connection = _open_database(db_path)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS place_ids (
+                point TEXT PRIMARY KEY,
+                place_id TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.commit()
+
+    # Return {point_key: place_id} for the cached, unexpired entries among point_keys.
+    def get_many(self, point_keys):
+        oldest = time.time() - self.ttl_seconds if self.ttl_seconds else 0
+        found = {}
+        with self._lock:
+            for point_key in point_keys:
+                row = self._connection.execute(
+                    'SELECT place_id FROM place_ids WHERE point = ? AND created_at >= ?',
+                    (point_key, oldest)
+                ).fetchone()
+                if row is not None:
+                    found[point_key] = row[0]
+        get_metrics().record_cache('geocode', hits=len(found), misses=len(point_keys) - len(found))
+        return found
+
+    # Store {point_key: place_id} lookups in one transaction.
+    def put_many(self, place_ids):
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO place_ids (point, place_id, created_at) VALUES (?, ?, ?)',
+                [(point_key, place_id, now) for point_key, place_id in place_ids.items()]
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class SheetSnapshotCache:
+    # Last values read from each sheet range, stored with the spreadsheet revision (Drive
+    # version and modifiedTime) current when they were read. A snapshot is only returned
+    # for the same revision, so any edit to the spreadsheet invalidates it. Rows are stored
+    # as JSON [row_number, values] pairs; one snapshot is kept per range.
+
+    def __init__(self, db_path=SHEET_SNAPSHOT_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = _open_database(db_path)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS snapshots (
+                spreadsheet_id TEXT NOT NULL,
+                range_key TEXT NOT NULL,
+                revision TEXT NOT NULL,
+                rows TEXT NOT NULL,
+                saved_at REAL NOT NULL,
+                PRIMARY KEY (spreadsheet_id, range_key)
+            )
+            """
+        )
+        self._connection.commit()
+
+    # Return the [(row_number, values)] snapshot of a range read at revision, or None.
+    def get(self, spreadsheet_id, range_key, revision):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT rows FROM snapshots WHERE spreadsheet_id = ? AND range_key = ? AND revision = ?',
+                (spreadsheet_id, range_key, revision)
+            ).fetchone()
+        get_metrics().record_cache('sheet_snapshot', hits=int(row is not None), misses=int(row is None))
+        return json.loads(row[0]) if row is not None else None
+
+    # Return (revision, [(row_number, values)], saved_at) of the last snapshot of a range, or None.
+    def get_latest(self, spreadsheet_id, range_key):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT revision, rows, saved_at FROM snapshots WHERE spreadsheet_id = ? AND range_key = ?',
+                (spreadsheet_id, range_key)
+            ).fetchone()
+        return (row[0], json.loads(row[1]), row[2]) if row is not None else None
+
+    # Replace the snapshot of a range with rows ([(row_number, values)]) read at revision.
+    def put(self, spreadsheet_id, range_key, revision, rows):
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO snapshots (spreadsheet_id, range_key, revision, rows, saved_at) VALUES (?, ?, ?, ?, ?)',
+                (spreadsheet_id, range_key, revision, json.dumps(rows), time.time())
+            )
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_route_cache = None
+_leg_store = None
+_geocode_cache = None
+_sheet_snapshot_cache = None
+_route_cache_lock = threading.Lock()
+
+
+# Shared route cache for the process; opened on first use.
+def get_route_cache():
+    global _route_cache
+    with _route_cache_lock:
+        if _route_cache is None:
+            _route_cache = RouteCache()
+        return _route_cache
+
+
+# Shared leg store for the process; opened on first use.
+def get_leg_store():
+    global _leg_store
+    with _route_cache_lock:
+        if _leg_store is None:
+            _leg_store = LegStore()
+        return _leg_store
+
+
+# Shared geocode cache for the process; opened on first use.
+def get_geocode_cache():
+    global _geocode_cache
+    with _route_cache_lock:
+        if _geocode_cache is None:
+            _geocode_cache = GeocodeCache()
+        return _geocode_cache
+
+
+# Shared sheet snapshot cache for the process; opened on first use.
+def get_sheet_snapshot_cache():
+    global _sheet_snapshot_cache
+    with _route_cache_lock:
+        if _sheet_snapshot_cache is None:
+            _sheet_snapshot_cache = SheetSnapshotCache()
+        return _sheet_snapshot_cache
@@ -0,0 +1,62 @@
+# FILE: ML_Distance_Estimate.py
+# VERSION: 0.01
+######################################
+# CHANGELOG
+######################################
+# 1. Initial version: offline great-circle mileage estimates and bulk sanity check of Directions API distances.
+
+import logging
+import numpy as np
+from functions.Data_Ingest.ML_Data_Processing import haversine_miles
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Roads are rarely straight: great-circle miles are multiplied by this factor
+ROAD_FACTOR = 1.3
+
+# Flag a day when API miles and the estimate differ by more than this fraction of the estimate
+DISTANCE_CHECK_THRESHOLD = 0.5
+
+# Below this many estimated miles the relative check is too noisy to be useful
+DISTANCE_CHECK_MIN_MILES = 2.0
+
+
+# Estimate the miles driven on every date from the stop coordinates alone: the sum of the
+# great-circle hops between consecutive stops, times road_factor. All hops of all dates are
+# computed in one vectorized pass. Returns {date: miles}.
+def estimate_date_miles(date_ordered_data, road_factor=ROAD_FACTOR):
+    dates = list(date_ordered_data.keys())
+    if not dates:
+        return {}
+
+    stop_counts = np.fromiter((len(date_ordered_data[date]) for date in dates), dtype=np.int64, count=len(dates))
+    total_stops = int(stop_counts.sum())
+    latitudes = np.fromiter((stop.latitude for date in dates for stop in date_ordered_data[date]), dtype=float, count=total_stops)
+    longitudes = np.fromiter((stop.longitude for date in dates for stop in date_ordered_data[date]), dtype=float, count=total_stops)
+
+    # Date of each stop; hops between the last stop of one date and the first of the next are dropped
+    date_of_stop = np.repeat(np.arange(len(dates)), stop_counts)
+    hops = haversine_miles(latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:])
+    same_day = date_of_stop[1:] == date_of_stop[:-1]
+    miles = np.bincount(date_of_stop[1:][same_day], weights=hops[same_day], minlength=len(dates)) * road_factor
+
+    return {date: round(float(date_miles), 2) for date, date_miles in zip(dates, miles)}
+
+
+# Compare the API miles of every report row with the offline estimate and return the days
+# that differ by more than threshold (relative to the estimate) as
+# [(date, api_miles, estimated_miles), ...]. A large gap usually means a bad waypoint.
+def check_api_distances(target_data, estimates, threshold=DISTANCE_CHECK_THRESHOLD, min_miles=DISTANCE_CHECK_MIN_MILES):
+    checked = [(row[0], row[1], estimates[row[0]]) for row in target_data if row[0] in estimates]
+    if not checked:
+        return []
+
+    api_miles = np.array([api for _, api, _ in checked], dtype=float)
+    estimated_miles = np.array([estimate for _, _, estimate in checked], dtype=float)
+    relative_gap = np.abs(api_miles - estimated_miles) / np.maximum(estimated_miles, min_miles)
+    flagged = [checked[index] for index in np.flatnonzero(relative_gap > threshold)]
+
+    for date, api, estimate in flagged:
+        logger.warning(f"Distance check: {date} has {api:.2f} API miles vs {estimate:.2f} estimated miles; check the waypoints for that day.")
+    return flagged
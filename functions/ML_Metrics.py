@@ -0,0 +1,147 @@
+# FILE: ML_Metrics.py
+# VERSION: 0.02
+######################################
+# CHANGELOG
+######################################
+# 1. Records rate limiter activity per budget: requests that had to wait, total wait and throttled responses.
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from datetime import datetime
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the API latency histogram buckets
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RunMetrics:
+    # Instrumentation for one processing run. Stages, API calls, cache lookups and counts are
+    # recorded from any thread and summarised by to_dict() / write_json().
+
+    def __init__(self):
+        self.started_at = datetime.now()
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.api_calls = defaultdict(Counter)
+        self.api_latencies = defaultdict(list)
+        self.cache = defaultdict(Counter)
+        self.rate_limits = defaultdict(Counter)
+        self.counts = {}
+
+    # Time a stage of the run: `with metrics.stage('route'): ...`
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + seconds
+            logger.info(f"Stage '{name}' completed in {seconds:.3f}s")
+
+    # Record one API call (one HTTP attempt) with its outcome status and latency.
+    def record_api_call(self, endpoint, status, seconds):
+        with self._lock:
+            self.api_calls[endpoint][str(status)] += 1
+            self.api_latencies[endpoint].append(seconds)
+
+    # Record cache lookups: hits and misses for the named cache.
+    def record_cache(self, cache_name, hits=0, misses=0):
+        with self._lock:
+            self.cache[cache_name]['hits'] += hits
+            self.cache[cache_name]['misses'] += misses
+
+    # Record rate limiter activity for a budget: seconds a request waited, or a throttled response.
+    def record_rate_limit(self, bucket_name, waited=0.0, throttled=False):
+        with self._lock:
+            counter = self.rate_limits[bucket_name]
+            if waited:
+                counter['waits'] += 1
+                counter['wait_seconds'] += waited
+            if throttled:
+                counter['throttled'] += 1
+
+    # Set a count such as rows, dates or error rows.
+    def set_count(self, name, value):
+        with self._lock:
+            self.counts[name] = value
+
+    # Summarise a list of latencies: count, mean, percentiles and a cumulative histogram.
+    @staticmethod
+    def _latency_summary(samples):
+        ordered = sorted(samples)
+        count = len(ordered)
+        histogram = {f"le_{bound}": sum(1 for sample in ordered if sample <= bound) for bound in LATENCY_BUCKETS}
+        histogram['le_inf'] = count
+        return {
+            'count': count,
+            'mean': sum(ordered) / count,
+            'p50': ordered[int(0.50 * (count - 1))],
+            'p95': ordered[int(0.95 * (count - 1))],
+            'max': ordered[-1],
+            'histogram': histogram,
+        }
+
+    def to_dict(self):
+        with self._lock:
+            cache = {}
+            for cache_name, counter in self.cache.items():
+                lookups = counter['hits'] + counter['misses']
+                cache[cache_name] = {
+                    'hits': counter['hits'],
+                    'misses': counter['misses'],
+                    'hit_ratio': round(counter['hits'] / lookups, 4) if lookups else None,
+                }
+            return {
+                'run_started': self.started_at.isoformat(timespec='seconds'),
+                'run_seconds': round(time.perf_counter() - self._started, 4),
+                'stages': {name: round(seconds, 4) for name, seconds in self.stages.items()},
+                'api_calls': {endpoint: dict(statuses) for endpoint, statuses in self.api_calls.items()},
+                'api_latency': {endpoint: self._latency_summary(samples) for endpoint, samples in self.api_latencies.items() if samples},
+                'cache': cache,
+                'rate_limits': {
+                    name: {'waits': counter['waits'], 'wait_seconds': round(counter['wait_seconds'], 4), 'throttled': counter['throttled']}
+                    for name, counter in self.rate_limits.items()
+                },
+                'counts': dict(self.counts),
+            }
+
+    # Write the metrics as JSON and return the file path.
+    def write_json(self, file_path):
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(file_path, 'w') as file:
+            json.dump(self.to_dict(), file, indent=2)
+        logger.info(f"Run metrics written to {file_path}")
+        return file_path
+
+
+_metrics = RunMetrics()
+
+
+# Metrics of the current run.
+def get_metrics():
+    return _metrics
+
+
+# Start a fresh set of metrics (one per run) and return it.
+def reset_metrics():
+    global _metrics
+    _metrics = RunMetrics()
+    return _metrics
+
+
+# Write the current run's metrics next to the OUTPUT artifacts.
+def write_run_metrics(output_dir='OUTPUT'):
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    return get_metrics().write_json(os.path.join(output_dir, f'mileage_log_metrics_{timestamp}.json'))
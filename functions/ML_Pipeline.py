@@ -0,0 +1,215 @@
+# FILE: ML_Pipeline.py
+# VERSION: 0.13
+######################################
+# CHANGELOG
+######################################
+# 1. Any error while resolving a date (not only MapsAPIError) fails just that date and is retried in the deferred pass.
+# 2. Offline runs read the source sheet from the last local snapshot when Google cannot be reached.
+
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functions.ML_API_GoogleSheets import read_sheet_rows
+from functions.ML_API_GoogleMaps import gMap_extract_distance_from_directions, MapsAPIError
+from functions.ML_Report_State import ReportState, RunJournal, fingerprint_rows
+from functions.Data_Ingest.ML_Data_Processing import cleanse_rows, parse_log_date
+from functions.Data_Ingest.ML_Date_Index import select_rows, sort_log_dates
+from functions.ML_Distance_Estimate import estimate_date_miles, check_api_distances, ROAD_FACTOR
+from functions.ML_Metrics import get_metrics
+from secret.ML_config import SOURCE_SHEET, DEBUG_MILEAGE
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Maximum number of Directions requests in flight at once
+ROUTE_WORKERS = 8
+
+# Pause before the deferred pass retries the dates whose Maps calls failed
+DEFERRED_RETRY_DELAY_SECONDS = 10
+
+
+class ReportModel:
+    # Result of the fetch/aggregate stage, handed to the render stage as-is.
+    # headers:      header row of the source sheet
+    # target_data:  [date, miles, route HTML, stop details HTML] per routed date
+    # error_rows:   source rows rejected by validation
+    # route_errors: source rows of dates for which no route could be resolved
+    # distance_flags: (date, API miles, estimated miles) of days failing the distance check
+    # date_range:   DateRange the report covers, or None for the whole log
+
+    def __init__(self, headers, target_data, error_rows, route_errors, distance_flags=None, date_range=None):
+        self.headers = headers
+        self.target_data = target_data
+        self.error_rows = error_rows
+        self.route_errors = route_errors
+        self.distance_flags = distance_flags or []
+        self.date_range = date_range
+
+
+# Resolve the route of a single date. Returns the date, its stops and the miles driven;
+# miles is None if the Maps API failed (after the client's own retries) for this date, or
+# resolving it raised anything else, e.g. a response missing the expected fields.
+def _resolve_date_route(date, locations):
+    gps_coordinates = [stop.coordinates for stop in locations]
+    try:
+        total_distance, end_addresses, link = gMap_extract_distance_from_directions(gps_coordinates, DEBUG_MILEAGE)
+    except MapsAPIError as error:
+        logger.warning(f"Route for {date} failed: {error}")
+        return date, locations, None
+    except Exception:
+        logger.exception(f"Route for {date} failed unexpectedly")
+        return date, locations, None
+    return date, locations, total_distance
+
+
+# Build the report entry of a resolved date: (target_data row or None, route error rows).
+def _build_date_entry(date, locations, total_distance):
+    if total_distance == 0:
+        return None, [stop.as_row(date) for stop in locations]
+
+    street_addresses = [f'<li><a href="https://www.google.com/maps/place/?q=place_id:{stop.place_id}">{stop.street_address}</a></li>' for stop in locations]
+    notes = [f'<li>{stop.business_name}</li>' for stop in locations]
+    return [date, total_distance, f"<ol>{''.join(street_addresses)}</ol>", f"<ol>{''.join(notes)}</ol>"], []
+
+
+# Resolve the route of every date and build the report rows. Dates without a route
+# contribute their source rows to route_errors instead. Up to max_workers dates are
+# resolved at once; the output keeps ascending date order regardless of completion order.
+# With a ReportState, dates whose rows are unchanged since the last run reuse their saved
+# entry and only the changed dates are resolved. With a RunJournal every resolved date is
+# checkpointed as soon as it is done, and checkpoints of a resumed run are reused. Dates
+# whose Maps calls fail are retried once in a deferred pass after all other dates; if they
+# still fail their rows go to route_errors and they are neither saved nor checkpointed, so
+# the next run retries them. In offline mode the miles come from the great-circle estimate
+# instead of the Directions API. When date_ordered_data covers only date_range, saved state
+# of dates outside it is kept for later runs.
+def build_target_data(date_ordered_data, max_workers=ROUTE_WORKERS, state=None, offline=False, road_factor=ROAD_FACTOR,
+                      journal=None, retry_delay=DEFERRED_RETRY_DELAY_SECONDS, date_range=None):
+    target_data = []
+    route_errors = []
+
+    # Sort the dates from least recent to most recent
+    sorted_dates = sort_log_dates(date_ordered_data.keys())
+
+    entries = {}
+    fingerprints = {}
+    pending_dates = []
+    for date in sorted_dates:
+        if state is not None or journal is not None:
+            fingerprints[date] = fingerprint_rows([stop.as_row(date) for stop in date_ordered_data[date]])
+            saved = (state and state.lookup(date, fingerprints[date])) or (journal and journal.lookup(date, fingerprints[date]))
+            if saved:
+                entries[date] = (saved['entry'], saved['route_errors'])
+                continue
+        pending_dates.append(date)
+
+    if state is not None or journal is not None:
+        logger.info(f"{'Incremental' if state is not None else 'Checkpointed'} run: {len(pending_dates)} of {len(sorted_dates)} dates to resolve.")
+        get_metrics().record_cache('report_state', hits=len(sorted_dates) - len(pending_dates), misses=len(pending_dates))
+    get_metrics().set_count('dates_resolved', len(pending_dates))
+
+    # Resolve one date and checkpoint it as soon as it succeeds
+    def resolve_and_checkpoint(date, locations):
+        date, locations, total_distance = _resolve_date_route(date, locations)
+        if total_distance is not None:
+            entries[date] = _build_date_entry(date, locations, total_distance)
+            if state is not None:
+                state.update(date, fingerprints[date], *entries[date])
+            if journal is not None:
+                journal.record(date, fingerprints[date], *entries[date])
+        return date, total_distance
+
+    pending_locations = [date_ordered_data[date] for date in pending_dates]
+    if offline:
+        estimates = estimate_date_miles({date: date_ordered_data[date] for date in pending_dates}, road_factor)
+        for date, locations in zip(pending_dates, pending_locations):
+            entries[date] = _build_date_entry(date, locations, estimates[date])
+            if state is not None:
+                state.update(date, fingerprints[date], *entries[date])
+        resolved = []
+    elif max_workers and max_workers > 1 and len(pending_dates) > 1:
+        logger.debug(f"Resolving {len(pending_dates)} routes with {max_workers} workers.")
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='route') as executor:
+            resolved = list(executor.map(resolve_and_checkpoint, pending_dates, pending_locations))
+    else:
+        resolved = [resolve_and_checkpoint(date, locations) for date, locations in zip(pending_dates, pending_locations)]
+
+    # Deferred pass: retry the failed dates one at a time once everything else is done
+    failed_dates = [date for date, total_distance in resolved if total_distance is None]
+    if failed_dates:
+        logger.warning(f"{len(failed_dates)} date(s) failed; retrying them in {retry_delay}s.")
+        time.sleep(retry_delay)
+        failed_dates = [date for date in failed_dates if resolve_and_checkpoint(date, date_ordered_data[date])[1] is None]
+    for date in failed_dates:
+        logger.error(f"Route for {date} failed again; its rows are reported as route errors.")
+        entries[date] = (None, [stop.as_row(date) for stop in date_ordered_data[date]])
+    get_metrics().set_count('failed_dates', len(failed_dates))
+
+    for date in sorted_dates:
+        entry, date_route_errors = entries[date]
+        if entry is not None:
+            target_data.append(entry)
+        route_errors.extend(date_route_errors)
+
+    if state is not None:
+        # A run over one period only saw its own dates: keep the saved dates of other periods
+        other_dates = [date for date in state.dates if date_range is not None and parse_log_date(date) not in date_range]
+        state.retain(sorted_dates + other_dates)
+        state.save()
+    if journal is not None:
+        journal.close(completed=not failed_dates)
+
+    return target_data, route_errors
+
+
+# Fetch/aggregate stage: read the source sheet once (from the local snapshot if the spreadsheet
+# is unchanged, unless refresh_sheet), group it by date and resolve every route. In incremental
+# mode only dates changed since the previous incremental run are resolved; report_state
+# replaces loading the saved state from disk. Online runs checkpoint every resolved date;
+# with resume the checkpoints of an interrupted or partly failed run are reused. With a
+# date_range only the rows of that period are cleansed and routed; the rest of the log is skipped.
+# Offline mode estimates the miles locally and never calls the Maps API, and falls back to the
+# last sheet snapshot if the spreadsheet cannot be reached; online runs check the API miles of
+# every day against that estimate.
+def build_report_model(sheet_name=SOURCE_SHEET, max_workers=ROUTE_WORKERS, incremental=False, offline=False, road_factor=ROAD_FACTOR,
+                       refresh_sheet=False, report_state=None, resume=False, date_range=None):
+    metrics = get_metrics()
+
+    # Read the source sheet: the first row holds the headers
+    with metrics.stage('read'):
+        sheet_rows = read_sheet_rows(sheet_name, refresh=refresh_sheet, offline=offline)
+    headers = sheet_rows[0].values if sheet_rows else []
+
+    with metrics.stage('select'):
+        data_rows = select_rows(sheet_rows[1:], date_range)
+
+    with metrics.stage('cleanse'):
+        date_ordered_data, error_rows = cleanse_rows(data_rows)
+
+    # Offline estimates must not replace API results saved for incremental runs
+    if incremental and offline:
+        logger.info("Offline mode: incremental state is neither used nor updated.")
+    state = None
+    if incremental and not offline:
+        state = report_state if report_state is not None else ReportState(sheet_name)
+    if resume and offline:
+        logger.info("Offline mode: nothing to resume, offline runs are not checkpointed.")
+    journal = None if offline else RunJournal(sheet_name, resume)
+    with metrics.stage('route'):
+        target_data, route_errors = build_target_data(date_ordered_data, max_workers, state, offline, road_factor, journal,
+                                                      date_range=date_range)
+
+    distance_flags = []
+    if not offline:
+        with metrics.stage('distance_check'):
+            distance_flags = check_api_distances(target_data, estimate_date_miles(date_ordered_data, road_factor))
+
+    metrics.set_count('rows', max(0, len(sheet_rows) - 1))
+    metrics.set_count('selected_rows', len(data_rows))
+    metrics.set_count('error_rows', len(error_rows))
+    metrics.set_count('dates', len(date_ordered_data))
+    metrics.set_count('report_rows', len(target_data))
+    metrics.set_count('route_error_rows', len(route_errors))
+    metrics.set_count('distance_flags', len(distance_flags))
+
+    return ReportModel(headers, target_data, error_rows, route_errors, distance_flags, date_range)
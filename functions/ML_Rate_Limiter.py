@@ -0,0 +1,136 @@
+# FILE: ML_Rate_Limiter.py
+# VERSION: 0.01
+######################################
+# CHANGELOG
+######################################
+# 1. Initial version: shared token-bucket rate limiter with a budget per Google endpoint that slows down on throttling.
+
+import logging
+import threading
+import time
+from functions.ML_Metrics import get_metrics
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Budgets per endpoint: (requests per minute, burst). Endpoint names are matched on their
+# longest dotted prefix, so 'sheets.values.batchGet' uses the 'sheets' budget. The values
+# stay just under Google's default quotas (Maps 3,000 QPM per API; Sheets and Docs 60 per
+# minute per user; Drive 12,000 per minute).
+RATE_LIMITS = {
+    'maps.directions': (2900, 40),
+    'maps.geocode': (2900, 40),
+    'sheets': (58, 10),
+    'docs': (58, 10),
+    'drive': (1000, 20),
+}
+
+# Adaptive slowdown: a throttled response cuts the rate by THROTTLE_DECREASE (at most once per
+# THROTTLE_COOLDOWN_SECONDS, never below MIN_RATE_FRACTION of the budget). Once
+# RECOVERY_DELAY_SECONDS have passed without throttling, successful calls raise the rate again
+# by RECOVERY_STEP of the budget per second.
+THROTTLE_DECREASE = 0.5
+THROTTLE_COOLDOWN_SECONDS = 1.0
+MIN_RATE_FRACTION = 0.05
+RECOVERY_DELAY_SECONDS = 5.0
+RECOVERY_STEP = 0.02
+
+
+class TokenBucket:
+    # Token bucket for one endpoint budget. Callers reserve a token and sleep off any debt
+    # outside the lock, so concurrent callers are spaced 1/rate apart in arrival order.
+
+    def __init__(self, name, requests_per_minute, burst):
+        self.name = name
+        self.max_rate = requests_per_minute / 60.0
+        self.min_rate = self.max_rate * MIN_RATE_FRACTION
+        self.rate = self.max_rate
+        self.burst = float(burst)
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.throttled_at = None
+        self.succeeded_at = None
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Take one token, waiting until it is available. Returns the seconds waited.
+    def acquire(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            delay = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if delay:
+            time.sleep(delay)
+        return delay
+
+    # A throttling response: halve the rate and drop any saved-up burst.
+    def throttled(self):
+        with self._lock:
+            now = time.monotonic()
+            if self.throttled_at is not None and now - self.throttled_at < THROTTLE_COOLDOWN_SECONDS:
+                return
+            self._refill(now)
+            self.rate = max(self.min_rate, self.rate * THROTTLE_DECREASE)
+            self.tokens = min(self.tokens, 0.0)
+            self.throttled_at = now
+        logger.warning(f"Throttled on {self.name}; slowing down to {self.rate * 60:.0f} requests/minute.")
+
+    # A successful response: creep back towards the full budget.
+    def succeeded(self):
+        if self.rate >= self.max_rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self.throttled_at >= RECOVERY_DELAY_SECONDS:
+                since = now - max(self.succeeded_at or now, self.throttled_at + RECOVERY_DELAY_SECONDS)
+                self._refill(now)
+                self.rate = min(self.max_rate, self.rate + self.max_rate * RECOVERY_STEP * since)
+            self.succeeded_at = now
+
+
+class RateLimiter:
+    # Process-wide scheduler: one TokenBucket per budget in RATE_LIMITS, shared by every
+    # thread and client. Endpoints without a budget are not limited.
+
+    def __init__(self, rate_limits=RATE_LIMITS):
+        self.buckets = {name: TokenBucket(name, *limit) for name, limit in rate_limits.items()}
+
+    # Bucket for an endpoint name: the longest dotted prefix with a budget, or None.
+    def bucket(self, endpoint):
+        name = endpoint
+        while name:
+            if name in self.buckets:
+                return self.buckets[name]
+            name = name.rpartition('.')[0]
+        return None
+
+    # Wait for the endpoint's budget before sending a request.
+    def acquire(self, endpoint):
+        bucket = self.bucket(endpoint)
+        if bucket is not None:
+            waited = bucket.acquire()
+            get_metrics().record_rate_limit(bucket.name, waited=waited)
+
+    # Report a throttling response (HTTP 429, OVER_QUERY_LIMIT, rateLimitExceeded).
+    def throttled(self, endpoint):
+        bucket = self.bucket(endpoint)
+        if bucket is not None:
+            bucket.throttled()
+            get_metrics().record_rate_limit(bucket.name, throttled=True)
+
+    # Report a successful response.
+    def succeeded(self, endpoint):
+        bucket = self.bucket(endpoint)
+        if bucket is not None:
+            bucket.succeeded()
+
+
+_rate_limiter = RateLimiter()
+
+
+# The rate limiter shared by all API clients.
+def get_rate_limiter():
+    return _rate_limiter
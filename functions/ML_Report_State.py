@@ -0,0 +1,146 @@
+# FILE: ML_Report_State.py
+# VERSION: 0.02
+######################################
+# CHANGELOG
+######################################
+# 1. Added RunJournal: every resolved date is checkpointed to an append-only journal as soon as it
+#    is done, so an interrupted or partly failed run can be resumed without repeating finished work.
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from functions.ML_Cache import CACHE_DIR
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+REPORT_STATE_FILE = os.path.join(CACHE_DIR, 'ML_report_state.json')
+RUN_JOURNAL_DIR = CACHE_DIR
+
+
+# Fingerprint one date's group of rows. The group is already sorted by stop order, so any
+# edit, insertion, deletion or reordering of that day's rows changes the fingerprint.
+def fingerprint_rows(rows):
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(json.dumps(row, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()
+
+
+class ReportState:
+    # Result of the previous run, per date: the fingerprint of its rows plus either the
+    # computed target_data entry or the rows that ended up in route_errors.
+
+    def __init__(self, sheet_name, state_path=REPORT_STATE_FILE):
+        self.sheet_name = sheet_name
+        self.state_path = state_path
+        self.dates = {}
+        self._load()
+
+    # Load the saved state for this sheet; a missing or unreadable file means a full run.
+    def _load(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as file:
+                saved = json.load(file)
+        except (OSError, ValueError) as error:
+            logger.warning(f"Ignoring unreadable report state {self.state_path}: {error}")
+            return
+        self.dates = saved.get(self.sheet_name, {})
+
+    # Return the saved entry for a date if its rows are unchanged, otherwise None.
+    def lookup(self, date, fingerprint):
+        saved = self.dates.get(date)
+        if saved is not None and saved['fingerprint'] == fingerprint:
+            return saved
+        return None
+
+    # Record the outcome for a date: entry is the target_data row (None if routing failed).
+    def update(self, date, fingerprint, entry, route_errors):
+        self.dates[date] = {'fingerprint': fingerprint, 'entry': entry, 'route_errors': route_errors}
+
+    # Forget dates that no longer appear in the sheet.
+    def retain(self, dates):
+        keep = set(dates)
+        self.dates = {date: saved for date, saved in self.dates.items() if date in keep}
+
+    # Write the state back, keeping the entries of other sheets intact.
+    def save(self):
+        saved = {}
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as file:
+                    saved = json.load(file)
+            except (OSError, ValueError):
+                saved = {}
+        saved[self.sheet_name] = self.dates
+
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.state_path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(saved, file, ensure_ascii=False)
+        os.replace(temp_path, self.state_path)
+
+
+class RunJournal:
+    # Checkpoints of the current run: one JSON line per resolved date (fingerprint, entry and
+    # route errors), appended and flushed as soon as the date is done. A run that completes
+    # deletes its journal; one that is interrupted or leaves failed dates keeps it, and a
+    # resumed run reuses every checkpoint whose rows are unchanged. A fresh run discards it.
+
+    def __init__(self, sheet_name, resume=False, journal_dir=RUN_JOURNAL_DIR):
+        self.sheet_name = sheet_name
+        self.journal_path = os.path.join(journal_dir, f"ML_run_journal_{re.sub(r'[^A-Za-z0-9_-]', '_', sheet_name)}.jsonl")
+        self.dates = {}
+        self._lock = threading.Lock()
+        if resume:
+            self._load()
+        elif os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        os.makedirs(journal_dir, exist_ok=True)
+        self._file = open(self.journal_path, 'a', encoding='utf-8')
+
+    # Read the checkpoints of an earlier run. A line cut short by a crash is skipped.
+    def _load(self):
+        if not os.path.exists(self.journal_path):
+            logger.info(f"No run journal at {self.journal_path}; nothing to resume.")
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    logger.warning(f"Skipping incomplete checkpoint in {self.journal_path}")
+                    continue
+                self.dates[record['date']] = record
+        logger.info(f"Resuming from {len(self.dates)} checkpointed dates in {self.journal_path}")
+
+    # Return the checkpoint of a date if its rows are unchanged, otherwise None.
+    def lookup(self, date, fingerprint):
+        saved = self.dates.get(date)
+        if saved is not None and saved['fingerprint'] == fingerprint:
+            return saved
+        return None
+
+    # Checkpoint a resolved date. Called from the route worker threads.
+    def record(self, date, fingerprint, entry, route_errors):
+        line = json.dumps({'date': date, 'fingerprint': fingerprint, 'entry': entry, 'route_errors': route_errors}, ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    # The run finished: with no failed dates left the journal is no longer needed.
+    def close(self, completed):
+        with self._lock:
+            self._file.close()
+            if completed:
+                os.remove(self.journal_path)
+            else:
+                logger.info(f"Run journal kept at {self.journal_path}; rerun with --resume to retry the failed dates.")
@@ -0,0 +1,101 @@
+# FILE: ML_Watch.py
+# VERSION: 0.03
+######################################
+# CHANGELOG
+######################################
+# 1. Run metrics start afresh at every poll, so the metrics of a long-running watcher stay bounded even when nothing changes.
+
+import logging
+import signal
+import threading
+from functions.ML_API_GoogleDrive import get_file_revision
+from functions.ML_API_GoogleSheets import read_sheet_rows
+from functions.ML_Distance_Estimate import ROAD_FACTOR
+from functions.ML_Metrics import reset_metrics, write_run_metrics
+from functions.ML_Pipeline import build_report_model, ROUTE_WORKERS
+from functions.ML_Report_State import ReportState, fingerprint_rows
+from functions.RENDER.ML_Render_Dispatch import render_targets
+from secret.ML_config import SPREADSHEET_ID, SOURCE_SHEET
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Seconds between two checks of the spreadsheet revision
+WATCH_POLL_SECONDS = 60
+
+# Outputs regenerated after every change
+WATCH_TARGETS = ('HTML', 'PDF')
+
+
+class SheetWatcher:
+    # Keeps one process (and with it the API clients, caches and incremental report state)
+    # alive between runs. Every poll costs one Drive metadata request; when the revision has
+    # changed the log tab is re-read, and only if its rows changed are the changed dates
+    # routed again and the outputs regenerated. Edits to other tabs, including the report
+    # tab the GSHEET target writes, change the revision but not the log and are skipped.
+
+    def __init__(self, sheet_name=SOURCE_SHEET, targets=WATCH_TARGETS, poll_seconds=WATCH_POLL_SECONDS,
+                 max_workers=ROUTE_WORKERS, offline=False, road_factor=ROAD_FACTOR, date_range=None):
+        self.sheet_name = sheet_name
+        self.targets = targets
+        self.poll_seconds = poll_seconds
+        self.max_workers = max_workers
+        self.offline = offline
+        self.road_factor = road_factor
+        self.date_range = date_range
+        self.stop_event = threading.Event()
+        self.revision = None
+        self.log_fingerprint = None
+        # Offline estimates must not replace API results saved for incremental runs
+        self.state = None if offline else ReportState(sheet_name)
+
+    # Ask the loop to finish the current cycle and exit; safe to call from a signal handler.
+    def stop(self, signum=None, frame=None):
+        if signum is not None:
+            logger.info(f"Received signal {signum}; stopping after the current cycle.")
+        self.stop_event.set()
+
+    # One poll: returns True if the outputs were regenerated.
+    def poll(self):
+        metrics = reset_metrics()
+        revision = get_file_revision(SPREADSHEET_ID)
+        if revision == self.revision:
+            logger.debug(f"Spreadsheet unchanged at revision {revision}.")
+            return False
+
+        # The rows are read into the snapshot cache, so the run below does not download them again
+        log_fingerprint = fingerprint_rows([row.values for row in read_sheet_rows(self.sheet_name)])
+        if log_fingerprint == self.log_fingerprint:
+            logger.info(f"Spreadsheet revision {revision} does not change {self.sheet_name}; nothing to render.")
+            self.revision = revision
+            return False
+
+        logger.info(f"Spreadsheet changed (revision {revision}); updating the report.")
+        with metrics.stage('build_report_model'):
+            report = build_report_model(self.sheet_name, self.max_workers, incremental=not self.offline, offline=self.offline,
+                                        road_factor=self.road_factor, report_state=self.state, date_range=self.date_range)
+        with metrics.stage('render'):
+            outputs = render_targets(report, self.targets)
+        write_run_metrics()
+
+        self.revision = revision
+        self.log_fingerprint = log_fingerprint
+        logger.info(f"Report updated: {', '.join(outputs.values()) or 'no outputs'}")
+        return True
+
+    # Poll until stop() is called or SIGINT/SIGTERM arrives. A failed cycle is logged and
+    # retried at the next poll; the previous handlers are restored on exit.
+    def run(self):
+        previous_handlers = {signum: signal.signal(signum, self.stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+        logger.info(f"Watching {self.sheet_name} every {self.poll_seconds}s; rendering {', '.join(self.targets)} on change.")
+        try:
+            while not self.stop_event.is_set():
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("Watch cycle failed; retrying at the next poll.")
+                self.stop_event.wait(self.poll_seconds)
+        finally:
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+        logger.info("Watch mode stopped.")
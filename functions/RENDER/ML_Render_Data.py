@@ -0,0 +1,62 @@
+# FILE: ML_Render_Data.py
+# VERSION: 0.02
+######################################
+# CHANGELOG
+######################################
+# 1. The JSON output lists the days flagged by the distance check with their API and estimated miles.
+
+import csv
+import json
+import logging
+import os
+from datetime import datetime
+from functions.RENDER.ML_Render_HTML import REPORT_COLUMNS, REPORT_TITLE, REPORT_AUTHOR, cell_items
+
+logger = logging.getLogger(__name__)
+
+# One report row as plain values: [date, miles, route addresses, stop details]
+def report_row_values(row):
+    return [row[0], round(row[1], 2), cell_items(row[2]), cell_items(row[3])]
+
+# Save the report as CSV (one line per date; route and stop details one item per line in their cell).
+def drive_Output_CSV(target_data):
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    csv_file_path = os.path.join('OUTPUT', f'mileage_log_report_{timestamp}.csv')
+
+    with open(csv_file_path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(REPORT_COLUMNS)
+        for row in target_data:
+            date, miles, route, stops = report_row_values(row)
+            writer.writerow([date, f"{miles:.2f}", '\n'.join(route), '\n'.join(stops)])
+
+    logger.info(f"CSV successfully created at {csv_file_path}")
+    return csv_file_path
+
+# Save the report as JSON: the rows with their route and stop lists, the total miles and the
+# days flagged by the distance check ((date, API miles, estimated miles) tuples).
+def drive_Output_JSON(target_data, distance_flags=None):
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    json_file_path = os.path.join('OUTPUT', f'mileage_log_report_{timestamp}.json')
+
+    rows = []
+    for row in target_data:
+        date, miles, route, stops = report_row_values(row)
+        rows.append({'date': date, 'miles': miles, 'route': route, 'stops': stops})
+    report = {
+        'title': REPORT_TITLE,
+        'author': REPORT_AUTHOR,
+        'generated': datetime.now().isoformat(timespec='seconds'),
+        'total_miles': round(sum(row[1] for row in target_data), 2),
+        'rows': rows,
+        'distance_flags': [
+            {'date': date, 'api_miles': round(float(api), 2), 'estimated_miles': round(float(estimate), 2)}
+            for date, api, estimate in distance_flags or []
+        ],
+    }
+
+    with open(json_file_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+
+    logger.info(f"JSON successfully created at {json_file_path}")
+    return json_file_path
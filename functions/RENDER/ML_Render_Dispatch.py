@@ -0,0 +1,106 @@
+# FILE: ML_Render_Dispatch.py
+# VERSION: 0.04
+######################################
+# CHANGELOG
+######################################
+# 1. The JSON and Google Doc outputs include the report's distance check flags.
+
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functions.RENDER.ML_Render_HTML import drive_Output_HTML, REPORT_COLUMNS
+from functions.RENDER.ML_Render_PDF import generate_report_pdf_with_timestamp
+from functions.RENDER.ML_Render_Data import drive_Output_CSV, drive_Output_JSON, report_row_values
+from functions.ML_API_GoogleDocs import gDoc_create_new_doc, gDoc_create_and_populate_table
+from functions.ML_API_GoogleSheets import clear_sheet, write_sheet
+from functions.ML_Metrics import get_metrics
+from secret.ML_config import TARGET_SHEET
+
+logger = logging.getLogger(__name__)
+
+RENDER_TARGETS = ('HTML', 'PDF', 'CSV', 'JSON', 'GDOC', 'GSHEET')
+
+# Targets produced for each OUTPUT_DESTINATION setting
+DESTINATION_TARGETS = {
+    'DRIVE': ('HTML', 'PDF'),
+    'GDOC': ('GDOC',),
+    'GSHEET': ('GSHEET',),
+    'ALL': RENDER_TARGETS,
+    'NONE': (),
+}
+
+# Targets for an OUTPUT_DESTINATION value: a destination name above, a single target or a list of targets.
+def targets_for_destination(destination):
+    if isinstance(destination, str):
+        destination = destination.upper()
+        if destination in DESTINATION_TARGETS:
+            return list(DESTINATION_TARGETS[destination])
+        destination = [destination]
+    targets = [target.upper() for target in destination]
+    unknown = [target for target in targets if target not in RENDER_TARGETS]
+    if unknown:
+        raise ValueError(f"Unknown render target(s) {unknown}; expected any of {', '.join(RENDER_TARGETS)}")
+    return targets
+
+def _render_html(report):
+    html_file_path, _ = drive_Output_HTML(report.target_data)
+    return html_file_path
+
+def _render_pdf(report):
+    return generate_report_pdf_with_timestamp(report.target_data)
+
+def _render_csv(report):
+    return drive_Output_CSV(report.target_data)
+
+def _render_json(report):
+    return drive_Output_JSON(report.target_data, report.distance_flags)
+
+def _render_gdoc(report):
+    title = f"Mileage Log Report {report.date_range}" if report.date_range is not None else "Mileage Log Report"
+    doc_id = gDoc_create_new_doc(title)
+    gDoc_create_and_populate_table(doc_id, report.target_data, report.error_rows, report.route_errors, report.distance_flags)
+    return f"https://docs.google.com/document/d/{doc_id}"
+
+# Replace the contents of TARGET_SHEET with the report: headings, one row per date and the total.
+def _render_gsheet(report):
+    rows = [list(REPORT_COLUMNS)]
+    for row in report.target_data:
+        date, miles, route, stops = report_row_values(row)
+        rows.append([date, miles, '\n'.join(route), '\n'.join(stops)])
+    rows.append(['Total Miles Driven', round(sum(row[1] for row in report.target_data), 2), '', ''])
+    clear_sheet(TARGET_SHEET)
+    write_sheet(TARGET_SHEET, rows)
+    return TARGET_SHEET
+
+RENDERERS = {
+    'HTML': _render_html,
+    'PDF': _render_pdf,
+    'CSV': _render_csv,
+    'JSON': _render_json,
+    'GDOC': _render_gdoc,
+    'GSHEET': _render_gsheet,
+}
+
+# Run one renderer as its own metrics stage (render_<target>).
+def _run_renderer(target, report):
+    with get_metrics().stage(f"render_{target.lower()}"):
+        return RENDERERS[target](report)
+
+# Produce every target from the same report model at once, so the set takes about as long as
+# the slowest renderer. Renderers run on threads: the Google outputs wait on the network and a
+# large PDF renders in its own process pool. A failing target is logged and does not stop the
+# others. Returns {target: output path, URL or sheet name} for the targets that succeeded.
+def render_targets(report, targets):
+    targets = list(dict.fromkeys(targets_for_destination(targets)))
+    if not targets:
+        return {}
+
+    outputs = {}
+    with ThreadPoolExecutor(max_workers=len(targets), thread_name_prefix='render') as executor:
+        futures = {target: executor.submit(_run_renderer, target, report) for target in targets}
+        for target, future in futures.items():
+            try:
+                outputs[target] = future.result()
+                logger.info(f"{target} output: {outputs[target]}")
+            except Exception:
+                logger.exception(f"Rendering {target} failed")
+    return outputs
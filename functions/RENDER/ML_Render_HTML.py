@@ -1,74 +1,145 @@
 # FILE: ML_Render_HTML.py
-# VERSION: 0.3
+# VERSION: 0.6
 ######################################
 # CHANGELOG
 ######################################
-# 1. Added inline CSS to ensure consistent styling in HTML and PDF outputs.
-# 2. Added timestamp to the HTML output filename.
+# 1. Added REPORT_COLUMNS and cell_items() so the CSV, JSON, Google Doc and Google Sheet outputs share the report's columns and plain-text cells.
 
+import html
+import io
 import os
+import re
 from datetime import datetime
 
+REPORT_TITLE = "Train Dream: Mileage Report"
+REPORT_AUTHOR = "Doug Daulton"
+
+# Column headings of every report output
+REPORT_COLUMNS = ["DATE", "MILES", "ROUTE", "STOP DETAILS"]
+
+REPORT_CSS = """
+    body { font-family: 'Open Sans', sans-serif; }
+    table.report { border-collapse: collapse; width: 100%; }
+    tr.title { vertical-align: middle; font-size: 10pt; font-weight: bold; }
+    td.title-left { padding: 5px; text-align: left; width: 70%; }
+    td.title-right { padding: 5px; text-align: right; width: 30%; }
+    tr.heading { background-color: #000000; color: #FFFFFF; vertical-align: middle; font-size: 11pt; }
+    th.center { padding: 5px; text-align: center; width: 10%; }
+    th.left { padding: 5px; text-align: left; }
+    tr.row-even { background-color: #FFFFFF; vertical-align: top; }
+    tr.row-odd { background-color: #FFFEB0; vertical-align: top; }
+    td.date { padding: 5px; width: 10%; vertical-align: top; text-align: center; }
+    td.miles { padding: 5px; width: 10%; vertical-align: top; text-align: center; font-weight: bold; font-size: 11pt; }
+    td.route { padding: 5px; width: 50%; vertical-align: top; line-height: 1.1; }
+    td.notes { padding: 5px; width: 30%; vertical-align: top; line-height: 1.1; }
+    tr.total { background-color: #000000; color: #FFFFFF; vertical-align: middle; font-size: 18pt; }
+    td.total { text-align: center; font-weight: bold; }
+    td.key { text-align: left; padding: 5px; width: 50%; }
+"""
+
+REPORT_HEADER = """<html>
+<head><title>Mileage Log Report</title>
+<style>{css}</style>
+</head>
+<body>
+<table border="1" class="report">
+<thead>
+<tr class="title" border="0">
+    <td colspan="3" class="title-left" border="0">{title}</td>
+    <td colspan="1" class="title-right" border="0">{author}</td>
+</tr>
+<tr class="heading">
+    <th class="center">DATE</th>
+    <th class="center">MILES</th>
+    <th class="left">ROUTE</th>
+    <th class="left">STOP DETAILS</th>
+</tr>
+</thead>
+<tbody>
+"""
+
+# Precompiled once: rendering a row is a single bound format call
+ROW_TEMPLATE = """<tr class="{row_class}">
+    <td class="date">{date}</td>
+    <td class="miles">{miles:.2f}</td>
+    <td class="route">{route}</td>
+    <td class="notes">{notes}</td>
+</tr>
+"""
+_render_row = ROW_TEMPLATE.format
+
+REPORT_FOOTER = """</tbody>
+<tr id="Total_Miles" class="total">
+    <td colspan="4" class="total">Total Miles Driven: {total_miles:.2f}</td>
+</tr>
+<tr id="Notes_Key">
+    <td colspan="2" class="key">
+        <strong>KEY</strong>
+        <ul>
+            <li><strong>PC:</strong> Picture Cars</li>
+            <li><strong>LS:</strong> Location Scout</li>
+        </ul>
+    </td>
+    <td colspan="2" class="key">
+        <strong>NOTES</strong>
+        <ul>
+            <li><strong>DATE:</strong> Links to a Google Maps Itinerary for the Route.</li>
+            <li><strong>ROUTE:</strong> Each waypoint is linked to a Google Pin for that address.</li>
+        </ul>
+    </td>
+</tr>
+</table>
+</body>
+</html>
+"""
+
+# Closes a section of the report that ends without the total and key rows
+SECTION_FOOTER = """</tbody>
+</table>
+</body>
+</html>
+"""
+
+ROW_CLASSES = ("row-even", "row-odd")
+
+_LIST_ITEM_PATTERN = re.compile(r"<li>(.*?)</li>", re.DOTALL)
+_TAG_PATTERN = re.compile(r"<[^>]+>")
+
+# Plain-text items of a route or stop details cell ("<ol><li>...</li></ol>"), links and tags removed.
+def cell_items(cell_html):
+    return [html.unescape(_TAG_PATTERN.sub("", item)).strip() for item in _LIST_ITEM_PATTERN.findall(cell_html)]
+
+# Stream the report for target_data to a text stream (file or buffer), one row at a time.
+# For a section of a larger report, row_offset is the index of its first row in the full
+# report and total_miles the full report's total; include_total=False ends the section
+# after its rows instead of with the total and key rows.
+def render_report_html(target_data, stream, row_offset=0, include_total=True, total_miles=None):
+    stream.write(REPORT_HEADER.format(css=REPORT_CSS, title=REPORT_TITLE, author=REPORT_AUTHOR))
+
+    section_miles = 0.0
+    for index, row in enumerate(target_data, start=row_offset):
+        stream.write(_render_row(row_class=ROW_CLASSES[index % 2], date=row[0], miles=row[1], route=row[2], notes=row[3]))
+        section_miles += row[1]
+
+    if include_total:
+        stream.write(REPORT_FOOTER.format(total_miles=section_miles if total_miles is None else total_miles))
+    else:
+        stream.write(SECTION_FOOTER)
+
+# Render the report to an in-memory string.
+def render_report_html_string(target_data, **section_options):
+    buffer = io.StringIO()
+    render_report_html(target_data, buffer, **section_options)
+    return buffer.getvalue()
+
+# Render the report, save it to OUTPUT with a timestamp and return (html_file_path, html_content).
 def drive_Output_HTML(target_data):
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    html_content = """
-    <html>
-    <head><title>Mileage Log Report</title></head>
-    <body style="font-family: 'Open Sans', sans-serif;">
-    <table border="1" style="border-collapse: collapse; width: 100%;">
-      <tr style="vertical-align: middle; font-size:10pt; font-weight: bold;" border="0">
-        <td colspan="3" style="padding: 5px; text-align: left; width: 70%;" border="0">Train Dream: Mileage Report</td>
-        <td colspan="1" style="padding: 5px; text-align: right; width: 30%;" border="0">Doug Daulton</td>
-    </tr>
-    <tr style="background-color: #000000; color: #FFFFFF; vertical-align: middle; font-size:11pt">
-        <th style="padding: 5px; text-align: center; width: 10%;">DATE</th>
-        <th style="padding: 5px; text-align: center; width: 10%;">MILES</th>
-        <th style="padding: 5px; text-align: left;">ROUTE</th>
-        <th style="padding: 5px; text-align: left;">STOP DETAILS</th>
-    </tr>
-    """
-
-    row_styles = ["background-color: #FFFFFF;", "background-color: #FFFEB0;"]
-    for index, row in enumerate(target_data):
-        style = row_styles[index % 2]
-        html_content += f"""
-        <tr style="{style} vertical-align: top;">
-            <td style="padding: 5px; width: 10%; vertical-align: top; text-align: center;">{row[0]}</td>
-            <td style="padding: 5px; width: 10%; vertical-align: top; text-align: center; font-weight: bold; font-size: 11pt;">{row[1]:.2f}</td>
-            <td style="padding: 5px; width: 50%; vertical-align: top; line-height: 1.1">{row[2]}</td>
-            <td style="padding: 5px; width: 30%; vertical-align: top; line-height: 1.1">{row[3]}</td>
-        </tr>
-        """
-
-    total_miles = sum(row[1] for row in target_data)
-    html_content += f"""
-    <tr id="Total_Miles" style="background-color: #000000; color: #FFFFFF; vertical-align: middle;font-size: 18pt;">
-        <td colspan="4" style="text-align: center; font-weight: bold;">Total Miles Driven: {total_miles:.2f}</td>
-    </tr>
-    <tr id="Notes_Key">
-        <td colspan="2" style="text-align: left;padding: 5px; width: 50%;">
-            <strong>KEY</strong>
-            <ul>
-                <li><strong>PC:</strong> Picture Cars</li>
-                <li><strong>LS:</strong> Location Scout</li>
-            </ul>
-        </td>
-        <td colspan="2" style="text-align: left;padding: 5px; width: 50%;">
-            <strong>NOTES</strong>
-            <ul>
-                <li><strong>DATE:</strong> Links to a Google Maps Itinerary for the Route.</li>
-                <li><strong>ROUTE:</strong> Each waypoint is linked to a Google Pin for that address.</li>
-            </ul>
-        </td>
-    </tr>
-    </table>
-    </body>
-    </html>
-    """
+    html_content = render_report_html_string(target_data)
 
     # Save the HTML content to a file with a timestamp
     html_file_path = os.path.join('OUTPUT', f'mileage_log_report_{timestamp}.html')
     with open(html_file_path, 'w') as file:
         file.write(html_content)
 
-    return html_file_path
+    return html_file_path, html_content
@@ -1,26 +1,120 @@
 # FILE: ML_Render_PDF.py
-# VERSION: 0.3
+# VERSION: 0.8
 ######################################
 # CHANGELOG
 ######################################
-# 1. Added inline CSS to ensure consistent styling in PDF outputs.
-# 2. Embedded 'Open Sans' font into the PDF.
-# 3. Added timestamp to the PDF output filename.
+# 1. The parsed stylesheets (xhtml2pdf's default CSS and REPORT_CSS) are cached per process, so each render,
+#    and each section render in a worker, no longer re-parses the same CSS text.
 
 import os  # Import os module
 import logging
+import math
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from io import BytesIO
-from xhtml2pdf import pisa
 from datetime import datetime
+from functions.RENDER.ML_Render_HTML import render_report_html_string, cell_items
+from functions.Data_Ingest.ML_Data_Processing import parse_log_date
 
 logger = logging.getLogger(__name__)
 
+# Bundled fonts (Open Sans 1.10, Apache License 2.0; see fonts/README.md)
+FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fonts')
+FONT_FAMILY = 'Open Sans'
+FONT_FILES = {
+    (0, 0): 'OpenSans-Regular.ttf',
+    (1, 0): 'OpenSans-Bold.ttf',
+    (0, 1): 'OpenSans-Italic.ttf',
+    (1, 1): 'OpenSans-BoldItalic.ttf',
+}
+
+# Chunked rendering: reports with more rows than PDF_CHUNK_THRESHOLD are rendered in sections,
+# PDF_WORKERS at a time, in worker processes started with PDF_START_METHOD. chunk_by='pages' splits the report into one run of whole pages per
+# worker; chunk_by='month' starts every month on a new page.
+PDF_CHUNK_THRESHOLD = 120
+PDF_CHUNK_BY = 'pages'
+PDF_WORKERS = min(8, os.cpu_count() or 1)
+PDF_START_METHOD = 'spawn'
+
+# Page model of the report layout (A4, REPORT_CSS; points), measured on xhtml2pdf output: the
+# height left for rows below the repeated title and headings, and a row's height from its
+# number of text lines. Cells wrap at the text widths of the route and stop details columns,
+# and every row is at least PDF_MIN_ROW_LINES high. Rows are never split across pages.
+PDF_PAGE_ROWS_HEIGHT = 737.0
+PDF_ROW_PADDING = 7.42
+PDF_LINE_HEIGHT = 8.68
+PDF_MIN_ROW_LINES = 2
+PDF_TEXT_SIZE = 8
+PDF_ROUTE_TEXT_WIDTH = 266
+PDF_NOTES_TEXT_WIDTH = 151
+
+# Register the bundled Open Sans TTFs with ReportLab once per process and map the CSS
+# font-family 'Open Sans' to them for every xhtml2pdf render. This is what an @font-face
+# rule would do, except xhtml2pdf re-parses @font-face TTFs on every render.
+# Returns the registered font name, or None if the fonts are not available.
+@lru_cache(maxsize=None)
+def register_report_fonts():
+    from xhtml2pdf import default as pisa_default
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    from reportlab.lib.fonts import addMapping
+
+    regular_path = os.path.join(FONT_DIR, FONT_FILES[(0, 0)])
+    if not os.path.exists(regular_path):
+        logger.warning(f"Bundled font not found at {regular_path}; PDFs will use Helvetica instead of {FONT_FAMILY}.")
+        return None
+
+    base_name = FONT_FAMILY.replace(' ', '')
+    registered = {}
+    for (bold, italic), file_name in FONT_FILES.items():
+        font_path = os.path.join(FONT_DIR, file_name)
+        if not os.path.exists(font_path):
+            continue
+        font_name = f"{base_name}_{bold}{italic}"
+        pdfmetrics.registerFont(TTFont(font_name, font_path))
+        registered[(bold, italic)] = font_name
+
+    # Styles without their own file fall back to the closest registered face
+    for bold, italic in FONT_FILES:
+        font_name = registered.get((bold, italic)) or registered.get((bold, 0)) or registered[(0, 0)]
+        addMapping(base_name, bold, italic, font_name)
+
+    # xhtml2pdf copies DEFAULT_FONT into every new context, so the family resolves without @font-face
+    for alias in (FONT_FAMILY.lower(), base_name.lower()):
+        pisa_default.DEFAULT_FONT[alias] = base_name
+    logger.debug(f"Registered bundled fonts: {registered}")
+    return base_name
+
+# Parse each stylesheet of an xhtml2pdf render once per process. xhtml2pdf parses its default CSS
+# and every <style> block again for every document; the parsed stylesheets only hold the rules,
+# so the result is kept by CSS text and reused by the next render in this process. CSS with
+# at-rules (@page, @font-face, @import) is always parsed, as those rules set up the render's
+# context (page templates, fonts) while they are parsed.
+@lru_cache(maxsize=None)
+def cache_report_css():
+    from xhtml2pdf.context import pisaContext
+
+    parse_css_source = pisaContext._parseCSSSource
+    parsed_css = {}
+
+    def parse_css_source_cached(context, text, source_name):
+        if '@' in text:
+            return parse_css_source(context, text, source_name)
+        key = (text, source_name, context.pathDirectory)
+        if key not in parsed_css:
+            parsed_css[key] = parse_css_source(context, text, source_name)
+        return parsed_css[key]
+
+    pisaContext._parseCSSSource = parse_css_source_cached
+
 def drive_Output_PDF(html_content, pdf_file_path):
-    # Embedding fonts in PDF
-    html_content = html_content.replace(
-        '<head>',
-        '<head><link href="https://fonts.googleapis.com/css2?family=Open+Sans&display=swap" rel="stylesheet">'
-    )
+    from xhtml2pdf import pisa
+
+    # Embedding fonts in PDF (local files, registered once per process)
+    register_report_fonts()
+    cache_report_css()
 
     # Convert HTML to PDF
     with open(pdf_file_path, "wb") as result:
@@ -35,3 +129,125 @@ def generate_pdf_with_timestamp(html_content):
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
     pdf_file_path = os.path.join('OUTPUT', f'mileage_log_report_{timestamp}.pdf')
     drive_Output_PDF(html_content, pdf_file_path)
+    return pdf_file_path
+
+# Month of a report row, from its date; rows whose date does not parse form their own section.
+def _row_month(row):
+    parsed = parse_log_date(row[0])
+    return (parsed.year, parsed.month) if parsed else row[0]
+
+# Number of lines the items of a cell wrap to at width (points), breaking between words.
+def _cell_lines(items, width, font_name):
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+
+    space = stringWidth(' ', font_name, PDF_TEXT_SIZE)
+    lines = 0
+    for item in items:
+        lines += 1
+        line_width = 0.0
+        for word in item.split():
+            word_width = stringWidth(word, font_name, PDF_TEXT_SIZE)
+            if line_width and line_width + space + word_width > width:
+                lines += 1
+                line_width = word_width
+            else:
+                line_width = line_width + space + word_width if line_width else word_width
+    return lines
+
+# Estimated height (points) of a report row in the PDF, see the page model above.
+def estimate_row_height(row, font_name='Helvetica'):
+    lines = max(PDF_MIN_ROW_LINES,
+                _cell_lines(cell_items(row[2]), PDF_ROUTE_TEXT_WIDTH, font_name),
+                _cell_lines(cell_items(row[3]), PDF_NOTES_TEXT_WIDTH, font_name))
+    return PDF_ROW_PADDING + PDF_LINE_HEIGHT * lines
+
+# Index of the first row of every page, laying the rows out the way xhtml2pdf does: a row
+# that does not fit on the current page starts the next one.
+def paginate_rows(target_data):
+    base_name = register_report_fonts()
+    font_name = f"{base_name}_00" if base_name else 'Helvetica'
+
+    page_starts = []
+    used = 0.0
+    for index, row in enumerate(target_data):
+        height = estimate_row_height(row, font_name)
+        if not page_starts or (used and used + height > PDF_PAGE_ROWS_HEIGHT):
+            page_starts.append(index)
+            used = 0.0
+        used += height
+    return page_starts
+
+# Split target_data into sections of (row_offset, rows). chunk_by='pages' gives at most
+# max_sections runs of whole pages, so each section ends where the single-pass PDF starts a
+# new page; chunk_by='month' gives one section per month.
+def split_report_sections(target_data, chunk_by=PDF_CHUNK_BY, max_sections=PDF_WORKERS):
+    if chunk_by == 'pages':
+        page_starts = paginate_rows(target_data)
+        pages_per_section = max(1, math.ceil(len(page_starts) / max(1, max_sections)))
+        section_starts = page_starts[::pages_per_section] + [len(target_data)]
+        return [(start, target_data[start:end]) for start, end in zip(section_starts, section_starts[1:])]
+    if chunk_by != 'month':
+        raise ValueError(f"Unknown chunk_by {chunk_by!r}; expected 'pages' or 'month'")
+
+    sections = []
+    months = OrderedDict()
+    for index, row in enumerate(target_data):
+        month = _row_month(row)
+        if month not in months:
+            months[month] = []
+            sections.append((index, months[month]))
+        months[month].append(row)
+    return sections
+
+# Render one section of the report to PDF bytes. Runs in a worker process, so the fonts are
+# registered and the CSS cache installed there (once per worker) and only the section's rows
+# and the PDF bytes are pickled.
+def _render_section_pdf(rows, row_offset, include_total, total_miles):
+    from xhtml2pdf import pisa
+
+    register_report_fonts()
+    cache_report_css()
+    html_content = render_report_html_string(rows, row_offset=row_offset, include_total=include_total, total_miles=total_miles)
+    buffer = BytesIO()
+    pisa_status = pisa.CreatePDF(BytesIO(html_content.encode('utf-8')), dest=buffer)
+    if pisa_status.err:
+        raise RuntimeError(f"PDF generation failed for the section starting at row {row_offset}")
+    return buffer.getvalue()
+
+# Render target_data as one PDF from sections rendered in parallel, merged in report order.
+# Every section repeats the title and column headings, keeps the alternating row styles of
+# the full report, and only the last one ends with the total of all sections.
+def drive_Output_PDF_chunked(target_data, pdf_file_path, chunk_by=PDF_CHUNK_BY, max_workers=PDF_WORKERS):
+    from pypdf import PdfWriter
+
+    sections = split_report_sections(target_data, chunk_by, max_workers)
+    if not sections:
+        sections = [(0, [])]
+    total_miles = sum(row[1] for row in target_data)
+    last = len(sections) - 1
+
+    with ProcessPoolExecutor(max_workers=max(1, min(max_workers, len(sections))),
+                             mp_context=multiprocessing.get_context(PDF_START_METHOD)) as executor:
+        futures = [
+            executor.submit(_render_section_pdf, rows, row_offset, index == last, total_miles)
+            for index, (row_offset, rows) in enumerate(sections)
+        ]
+        section_pdfs = [future.result() for future in futures]
+
+    writer = PdfWriter()
+    for section_pdf in section_pdfs:
+        writer.append(BytesIO(section_pdf))
+    with open(pdf_file_path, "wb") as result:
+        writer.write(result)
+    logger.info(f"PDF successfully created at {pdf_file_path} from {len(sections)} sections")
+
+# Render the PDF for target_data and save it to OUTPUT with a timestamp. Large reports use the
+# chunked renderer; smaller ones render html_content (or target_data) in a single pass.
+def generate_report_pdf_with_timestamp(target_data, html_content=None, chunk_by=PDF_CHUNK_BY, max_workers=PDF_WORKERS):
+    if len(target_data) <= PDF_CHUNK_THRESHOLD or max_workers <= 1:
+        return generate_pdf_with_timestamp(html_content or render_report_html_string(target_data))
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    pdf_file_path = os.path.join('OUTPUT', f'mileage_log_report_{timestamp}.pdf')
+    drive_Output_PDF_chunked(target_data, pdf_file_path, chunk_by, max_workers)
+    return pdf_file_path